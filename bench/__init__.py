@@ -0,0 +1,5 @@
+"""
+benchmarks of the parser phases on synthetic headers and on the data/ fixtures.
+
+    python -m bench --classes 500 --output results.json --baseline baseline.json
+"""
@@ -0,0 +1,56 @@
+import sys
+import argparse
+import tempfile
+from bench import generator, runner
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="benchmark the parser phases")
+    parser.add_argument("--classes", type=int, default=200)
+    parser.add_argument("--methods", type=int, default=20)
+    parser.add_argument("--template-depth", type=int, default=3)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--classes-per-header", type=int, default=10)
+    parser.add_argument("--objc-categories", type=int, default=0)
+    parser.add_argument("--no-fixtures", action="store_true", help="skip the files of data/")
+    parser.add_argument("--work-dir", help="where the synthetic headers are written")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the results as json")
+    parser.add_argument("--baseline", help="compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    config = generator.GeneratorConfig(args.classes, args.methods, args.template_depth, args.fan_out,
+                                       args.classes_per_header, args.objc_categories)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="cparser-bench-")
+
+    cases = []
+    if config.classes > 0:
+        cpp_path = generator.generate_cpp(work_dir, config)
+        # the classes are in the headers, bench_main.cpp only includes them
+        cases.append(runner.BenchCase("synthetic/cpp", cpp_path, ["-x", "c++", "-std=c++11", "-I", work_dir],
+                                      [work_dir]))
+    objc_path = generator.generate_objc(work_dir, config)
+    if objc_path is not None:
+        cases.append(runner.BenchCase("synthetic/objc", objc_path, ["-x", "objective-c", "-I", work_dir],
+                                      [work_dir]))
+    if not args.no_fixtures:
+        cases.extend(runner.get_fixture_cases())
+
+    results = runner.run(cases, args.repeat, config.to_dict())
+    print(runner.format_results(results))
+    if args.output:
+        runner.save(results, args.output)
+
+    if args.baseline:
+        rows = runner.compare(results, runner.load(args.baseline), args.threshold)
+        print("")
+        print(runner.format_comparison(rows))
+        if any(row[5] for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import os
+
+# small stand-ins for the std containers, the benchmark doesn't depend on the system headers
+_std_header = """#ifndef BENCH_STD_H
+#define BENCH_STD_H
+namespace std
+{
+template <class T> class allocator {};
+template <class C> class char_traits {};
+template <class C, class T = char_traits<C>, class A = allocator<C> > class basic_string
+{
+public:
+    basic_string();
+    const C* c_str() const;
+};
+typedef basic_string<char> string;
+template <class T, class A = allocator<T> > class vector
+{
+public:
+    void push_back(const T& value);
+};
+template <class K, class V> class map
+{
+public:
+    V& operator[](const K& key);
+};
+template <class F> class function;
+template <class R, class... Args> class function<R(Args...)>
+{
+public:
+    R operator()(Args... args) const;
+};
+}
+#endif
+"""
+
+_objc_base_header = """#ifndef BENCH_OBJC_BASE_H
+#define BENCH_OBJC_BASE_H
+@interface BenchObject
+{
+    int _retainCount;
+}
+- (id)init;
+- (void)release;
+@end
+#endif
+"""
+
+
+class GeneratorConfig(object):
+    def __init__(self, classes=200, methods=20, template_depth=3, fan_out=4, classes_per_header=10,
+                 objc_categories=0):
+        self.classes = classes
+        self.methods = methods
+        self.template_depth = template_depth
+        self.fan_out = fan_out
+        self.classes_per_header = classes_per_header
+        self.objc_categories = objc_categories
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def _nested_type(depth):
+    """
+    a container type nested depth times, like std::vector<std::map<int, std::string> >
+    """
+    nested = "std::string"
+    for i in range(depth):
+        if i % 3 == 0:
+            nested = "std::vector<%s >" % nested
+        elif i % 3 == 1:
+            nested = "std::map<int, %s >" % nested
+        else:
+            nested = "std::function<void (%s, int)>" % nested
+    return nested
+
+
+def _class_source(index, config):
+    lines = []
+    parent = " : public Class%d" % (index // 2) if index > 0 else ""
+    lines.append("class Class%d%s" % (index, parent))
+    lines.append("{")
+    lines.append("public:")
+    lines.append("    Class%d();" % index)
+    lines.append("    virtual ~Class%d();" % index)
+    for m in range(config.methods):
+        depth = m % (config.template_depth + 1)
+        kind = m % 4
+        if kind == 0:
+            lines.append("    /** method %d */" % m)
+            lines.append("    virtual int method%d(int a, float b = 1.0f);" % m)
+        elif kind == 1:
+            lines.append("    void method%d(const %s& value);" % (m, _nested_type(depth)))
+        elif kind == 2:
+            lines.append("    %s method%d() const;" % (_nested_type(depth), m))
+        else:
+            lines.append("    static Class%d* method%d(const std::string& name, int count = 0);" % (index, m))
+    lines.append("protected:")
+    lines.append("    int _field%d;" % index)
+    lines.append("    %s _values;" % _nested_type(config.template_depth))
+    lines.append("};")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def generate_cpp(out_dir, config):
+    """
+    write the synthetic c++ headers and return the path of the file including all of them.
+    every header includes the fan_out headers before it, so the include graph is dense
+    """
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(os.path.join(out_dir, "bench_std.h"), "w") as f:
+        f.write(_std_header)
+
+    header_names = []
+    header_count = (config.classes + config.classes_per_header - 1) // config.classes_per_header
+    for h in range(header_count):
+        header_name = "bench_%d.h" % h
+        guard = "BENCH_%d_H" % h
+        lines = ["#ifndef %s" % guard, "#define %s" % guard, '#include "bench_std.h"']
+        for included in header_names[-config.fan_out:] if config.fan_out > 0 else []:
+            lines.append('#include "%s"' % included)
+        lines.append("namespace bench")
+        lines.append("{")
+        first = h * config.classes_per_header
+        for index in range(first, min(first + config.classes_per_header, config.classes)):
+            lines.append(_class_source(index, config))
+        lines.append("}")
+        lines.append("#endif")
+        with open(os.path.join(out_dir, header_name), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        header_names.append(header_name)
+
+    main_path = os.path.join(out_dir, "bench_main.cpp")
+    with open(main_path, "w") as f:
+        for header_name in header_names:
+            f.write('#include "%s"\n' % header_name)
+    return main_path
+
+
+def generate_objc(out_dir, config):
+    """
+    write an objc header with the base interface and objc_categories categories of it,
+    return its path or None if no category is asked
+    """
+    if config.objc_categories <= 0:
+        return None
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with open(os.path.join(out_dir, "bench_objc_base.h"), "w") as f:
+        f.write(_objc_base_header)
+
+    lines = ['#import "bench_objc_base.h"', "@interface BenchView : BenchObject", "@property int tag;", "@end"]
+    for c in range(config.objc_categories):
+        lines.append("@interface BenchView (Category%d)" % c)
+        for m in range(config.methods):
+            lines.append("- (int)category%dMethod%d:(int)value other:(float)other;" % (c, m))
+        lines.append("@end")
+    objc_path = os.path.join(out_dir, "bench_objc.m")
+    with open(objc_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    return objc_path
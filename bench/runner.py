@@ -0,0 +1,231 @@
+import os
+import json
+import glob
+import timeit
+from collections import OrderedDict
+from clang import cindex
+from cparser.parser import Parser, get_clang_version
+from cparser.infos import TypeInfo
+from cparser import utils
+
+FORMAT_NAME = "cparser-bench"
+FORMAT_VERSION = 2
+
+data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+_type_cursor_kinds = frozenset([
+    cindex.CursorKind.PARM_DECL,
+    cindex.CursorKind.FIELD_DECL,
+    cindex.CursorKind.VAR_DECL,
+    cindex.CursorKind.TYPEDEF_DECL
+])
+
+_function_cursor_kinds = frozenset([
+    cindex.CursorKind.FUNCTION_DECL,
+    cindex.CursorKind.CXX_METHOD,
+    cindex.CursorKind.OBJC_INSTANCE_METHOD_DECL,
+    cindex.CursorKind.OBJC_CLASS_METHOD_DECL
+])
+
+
+class BenchCase(object):
+    def __init__(self, name, file_path, clang_args, header_dirs=None):
+        self.name = name
+        self.file_path = file_path
+        self.clang_args = clang_args
+        # the declarations of the headers under these directories are extracted too
+        self.header_dirs = header_dirs
+
+
+def get_fixture_cases():
+    """
+    the files of data/ which have a main role, headers are parsed through them
+    """
+    cases = []
+    for file_path in sorted(glob.glob(os.path.join(data_dir, "*"))):
+        ext = os.path.splitext(file_path)[1]
+        if ext == ".cpp":
+            clang_args = ["-x", "c++", "-I", data_dir]
+        elif ext == ".m":
+            clang_args = ["-x", "objective-c", "-I", data_dir]
+        elif ext == ".mm":
+            clang_args = ["-x", "objective-c++", "-I", data_dir]
+        else:
+            continue
+        cases.append(BenchCase("data/" + os.path.basename(file_path), file_path, clang_args, [data_dir]))
+    return cases
+
+
+def _make_parser(case, stats=False):
+    return Parser({'clang_args': list(case.clang_args), 'win32_clang_flags': None, 'header_dirs': case.header_dirs,
+                   'stats': stats})
+
+
+def _time_runs(func, repeat):
+    runs = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        func()
+        runs.append(timeit.default_timer() - start)
+    return _summarize(runs)
+
+
+def _time_traverse(case, repeat):
+    """
+    time the extraction of the declarations by the phases of the parser stats, the
+    translation unit is parsed again by a new parser every run.
+    return the timings and the parser of the last run
+    """
+    runs = []
+    parser = None
+    for i in range(repeat):
+        parser = _make_parser(case, stats=True)
+        parser.parse_file(case.file_path)
+        phases = parser.get_stats()['files'][0]['phases']
+        runs.append(phases['traverse'] + phases.get('headers', 0.0))
+    return _summarize(runs), parser
+
+
+def _summarize(runs):
+    ordered = sorted(runs)
+    return OrderedDict([
+        ("min", ordered[0]),
+        ("median", ordered[len(ordered) // 2]),
+        ("mean", sum(ordered) / len(ordered)),
+        ("runs", runs)
+    ])
+
+
+def _collect_types(tu):
+    types = []
+    for cursor in tu.cursor.walk_preorder(kinds=_type_cursor_kinds | _function_cursor_kinds):
+        if cursor.kind in _function_cursor_kinds:
+            types.append(cursor.result_type)
+        else:
+            types.append(cursor.type)
+    return types
+
+
+def _reset_type_caches():
+    TypeInfo.type_cache.clear()
+    utils.clear_name_cache()
+
+
+def run_case(case, repeat):
+    """
+    time every phase of the parser on one file, the phases run on the same translation unit
+    """
+    parser = _make_parser(case)
+    results = OrderedDict()
+
+    results["index_parse"] = _time_runs(
+        lambda: parser.index.parse(case.file_path, parser.clang_args, options=parser.parse_options), repeat)
+
+    results["traverse"], parser = _time_traverse(case, repeat)
+
+    tu = parser.index.parse(case.file_path, parser.clang_args, options=parser.parse_options)
+
+    types = _collect_types(tu)
+
+    def from_type():
+        for type_cursor in types:
+            TypeInfo.from_type(type_cursor)
+
+    def cold_from_type():
+        _reset_type_caches()
+        from_type()
+
+    results["from_type"] = _time_runs(cold_from_type, repeat)
+    results["from_type_warm"] = _time_runs(from_type, repeat)
+
+    type_names = [type_cursor.spelling for type_cursor in types]
+
+    def normalize():
+        for type_name in type_names:
+            utils.normalize_type_str(type_name)
+
+    def cold_normalize():
+        utils.clear_name_cache()
+        normalize()
+
+    results["normalize_type_str"] = _time_runs(cold_normalize, repeat)
+    results["normalize_type_str_warm"] = _time_runs(normalize, repeat)
+
+    if not parser.parsed_classes:
+        raise Exception("No class extracted from %s, the phases would measure nothing" % case.file_path)
+    results["sorted_classes"] = _time_runs(parser.sorted_classes, repeat)
+
+    counts = OrderedDict([
+        ("diagnostics", len(tu.diagnostics)),
+        ("classes", len(parser.parsed_classes)),
+        ("methods", len(parser.methods)),
+        ("types", len(types))
+    ])
+    return OrderedDict([("file", case.file_path), ("counts", counts), ("phases", results)])
+
+
+def run(cases, repeat=5, config=None):
+    results = OrderedDict([
+        ("format", FORMAT_NAME),
+        ("version", FORMAT_VERSION),
+        ("clang_version", get_clang_version()),
+        ("repeat", repeat),
+        ("config", config or {}),
+        ("cases", OrderedDict())
+    ])
+    for case in cases:
+        results["cases"][case.name] = run_case(case, repeat)
+    return results
+
+
+def save(results, path):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get("format") != FORMAT_NAME or results.get("version") != FORMAT_VERSION:
+        raise Exception("%s is not a benchmark result of version %d" % (path, FORMAT_VERSION))
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    compare the minimum times of the phases with the baseline.
+    return the rows (case, phase, baseline, current, ratio, regressed), a phase
+    regresses when it is slower than the baseline by more than threshold
+    """
+    rows = []
+    for case_name, case in results["cases"].iteritems():
+        baseline_case = baseline["cases"].get(case_name)
+        if baseline_case is None:
+            continue
+        for phase, stats in case["phases"].iteritems():
+            baseline_stats = baseline_case["phases"].get(phase)
+            if baseline_stats is None:
+                continue
+            baseline_time = baseline_stats["min"]
+            current_time = stats["min"]
+            ratio = current_time / baseline_time if baseline_time > 0 else 1.0
+            rows.append((case_name, phase, baseline_time, current_time, ratio, ratio > 1.0 + threshold))
+    return rows
+
+
+def format_results(results):
+    lines = []
+    for case_name, case in results["cases"].iteritems():
+        lines.append("%s %s" % (case_name, " ".join("%s=%d" % item for item in case["counts"].iteritems())))
+        for phase, stats in case["phases"].iteritems():
+            lines.append("    %-26s min %9.3f ms  median %9.3f ms" % (phase, stats["min"] * 1000,
+                                                                      stats["median"] * 1000))
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    lines = []
+    for case_name, phase, baseline_time, current_time, ratio, regressed in rows:
+        lines.append("%-30s %-26s %9.3f ms -> %9.3f ms  x%.2f%s" % (
+            case_name, phase, baseline_time * 1000, current_time * 1000, ratio, "  REGRESSED" if regressed else ""))
+    return "\n".join(lines)
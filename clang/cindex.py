@@ -648,6 +648,15 @@ class BaseEnumeration(object):
     def __repr__(self):
         return '%s.%s' % (self.__class__, self.name,)
 
+    def __reduce__(self):
+        # Enumeration values are singletons, so unpickle them by id instead
+        # of creating a new (unequal) instance.
+        return (_enumeration_from_id, (self.__class__, self.value))
+
+
+def _enumeration_from_id(cls, id):
+    return cls.from_id(id)
+
 
 class CursorKind(BaseEnumeration):
     """
@@ -1425,6 +1434,9 @@ class Cursor(Structure):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return self.hash
+
     def is_definition(self):
         """
         Returns true if the declaration pointed at by the cursor is also a
@@ -1816,32 +1828,88 @@ class Cursor(Structure):
         return conf.lib.clang_Cursor_getTemplateArgumentUnsignedValue(self, num)
 
     def get_children(self):
-        """Return an iterator for accessing the children of this cursor."""
+        """Return an iterator for accessing the children of this cursor.
 
-        # FIXME: Expose iteration from CIndex, PR6125.
-        def visitor(child, parent, children):
-            # FIXME: Document this assertion in API.
-            # FIXME: There should just be an isNull method.
-            assert child != conf.lib.clang_getNullCursor()
+        The children are collected in a single visit and cached on the cursor,
+        so iterating them again does not call back into libclang.
+        """
+        if not hasattr(self, '_children'):
+            self._children = self._get_children_list()
+        return iter(self._children)
 
-            # Create reference to TU so it isn't GC'd before Cursor.
-            child._tu = self._tu
-            children.append(child)
-            return 1 # continue
-        children = []
-        conf.lib.clang_visitChildren(self, callbacks['cursor_visit'](visitor),
-            children)
-        return iter(children)
+    def has_children(self):
+        """Return True if the cursor has at least one child.
+
+        Unless the children are already cached, the visit stops at the first
+        child instead of collecting all of them.
+        """
+        if hasattr(self, '_children'):
+            return len(self._children) > 0
+        return conf.lib.clang_visitChildren(self, _first_child_visitor,
+            None) != 0
 
-    def walk_preorder(self):
+    def walk_preorder(self, kinds=None, prune=None, descend=None,
+                      max_depth=None, file=None):
         """Depth-first preorder walk over the cursor and its descendants.
 
         Yields cursors.
+
+        The walk uses an explicit stack, so deep trees don't hit the recursion
+        limit. It can be narrowed with:
+
+          kinds -- only yield cursors of these kinds, the descendants of
+                   other cursors are still walked.
+          prune -- a predicate, cursors for which it returns True are skipped
+                   together with their descendants.
+          descend -- a predicate, the children of cursors for which it
+                     returns False are not walked.
+          max_depth -- do not walk below this depth, the cursor itself is at
+                       depth 0.
+          file -- a File, only walk descendants located in it. Other
+                  cursors are dropped by comparing file handles while
+                  visiting, before they are handed to Python code.
+        """
+        stack = [(self, 0)]
+        while stack:
+            cursor, depth = stack.pop()
+            if prune is not None and prune(cursor):
+                continue
+            if kinds is None or cursor.kind in kinds:
+                yield cursor
+            if max_depth is not None and depth >= max_depth:
+                continue
+            if descend is not None and not descend(cursor):
+                continue
+            children = cursor._get_children_list(file)
+            for i in xrange(len(children) - 1, -1, -1):
+                stack.append((children[i], depth + 1))
+
+    def get_children_in_file(self, file):
+        """Return an iterator for accessing the children of this cursor which
+        are located in the given File.
+
+        Children without a location are included as well.
         """
-        yield self
-        for child in self.get_children():
-            for descendant in child.walk_preorder():
-                yield descendant
+        return iter(self._get_children_list(file))
+
+    def _get_children_list(self, file=None):
+        # Walks visit each cursor once, so don't keep the whole tree alive by
+        # caching the children of every cursor on the way.
+        if file is None and hasattr(self, '_children'):
+            return self._children
+        # FIXME: Expose iteration from CIndex, PR6125.
+        children = []
+        if file is None:
+            conf.lib.clang_visitChildren(self, _collect_children_visitor,
+                children)
+        else:
+            conf.lib.clang_visitChildren(self, _collect_file_children_visitor,
+                (children, _file_handle(file.obj)))
+        # Create reference to TU so it isn't GC'd before Cursor.
+        tu = self._tu
+        for child in children:
+            child._tu = tu
+        return children
 
     def get_tokens(self):
         """Obtain Token instances formulating that compose this Cursor.
@@ -3103,6 +3171,16 @@ class File(ClangObject):
         """Return the last modification time of the file."""
         return conf.lib.clang_getFileTime(self)
 
+    def __eq__(self, other):
+        return isinstance(other, File) and \
+            _file_handle(self.obj) == _file_handle(other.obj)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(_file_handle(self.obj))
+
     def __str__(self):
         return self.name
 
@@ -3320,6 +3398,52 @@ callbacks['translation_unit_includes'] = CFUNCTYPE(None, c_object_p,
 callbacks['cursor_visit'] = CFUNCTYPE(c_int, Cursor, Cursor, py_object)
 callbacks['fields_visit'] = CFUNCTYPE(c_int, Cursor, py_object)
 
+# Shared visitors of Cursor.get_children and Cursor.has_children, creating a
+# callback object per visit is much more expensive than the visit itself.
+
+# Number of calls into the shared visitors, read by profiling tools.
+cursor_visit_calls = [0]
+
+def _collect_children(child, parent, children):
+    cursor_visit_calls[0] += 1
+    children.append(child)
+    return 1 # continue
+
+def _stop_at_first_child(child, parent, data):
+    cursor_visit_calls[0] += 1
+    return 0 # break
+
+def _collect_file_children(child, parent, data):
+    cursor_visit_calls[0] += 1
+    children, handle = data
+    child_handle = _cursor_file_handle(child)
+    if child_handle is None or child_handle == handle:
+        children.append(child)
+    return 1 # continue
+
+_collect_children_visitor = callbacks['cursor_visit'](_collect_children)
+_first_child_visitor = callbacks['cursor_visit'](_stop_at_first_child)
+_collect_file_children_visitor = callbacks['cursor_visit'](
+    _collect_file_children)
+
+def _file_handle(file_p):
+    """Return the address of a CXFile as an int, or None for a null file."""
+    if not file_p:
+        return None
+    return addressof(file_p.contents)
+
+def _cursor_file_handle(cursor):
+    # Same rules as Cursor.location.file, falling back to the start of the
+    # extent, but without building File objects or file names.
+    f = c_object_p()
+    conf.lib.clang_getInstantiationLocation(
+        conf.lib.clang_getCursorLocation(cursor), byref(f), None, None, None)
+    if not f:
+        conf.lib.clang_getInstantiationLocation(
+            conf.lib.clang_getRangeStart(conf.lib.clang_getCursorExtent(cursor)),
+            byref(f), None, None, None)
+    return _file_handle(f)
+
 # Functions strictly alphabetical order.
 functionList = [
   ("clang_annotateTokens",
@@ -4077,6 +4201,82 @@ def register_function(lib, item, ignore_errors):
     if len(item) == 4:
         func.errcheck = item[3]
 
+    if Config.profiling:
+        setattr(lib, item[0], _ProfiledFunction(item[0], func))
+
+# Opt-in profiling of the libclang entry points, see Config.set_profiling.
+# name -> [calls, total seconds, seconds not spent in nested libclang calls]
+libclang_profile = {}
+_profile_stack = []
+
+try:
+    from time import perf_counter as _profile_timer
+except ImportError:
+    from timeit import default_timer as _profile_timer
+
+class _ProfiledFunction(object):
+    """Wraps a registered libclang function to count calls and time them.
+
+    Calls made from Python callbacks, e.g. while visiting children, are
+    nested; their time is excluded from the self time of the caller.
+    """
+    __slots__ = ('name', 'func', 'stats')
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.stats = libclang_profile.setdefault(name, [0, 0.0, 0.0])
+
+    def __call__(self, *args):
+        _profile_stack.append(0.0)
+        start = _profile_timer()
+        try:
+            return self.func(*args)
+        finally:
+            elapsed = _profile_timer() - start
+            nested = _profile_stack.pop()
+            stats = self.stats
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] += elapsed - nested
+            if _profile_stack:
+                _profile_stack[-1] += elapsed
+
+def get_libclang_profile():
+    """Return (name, calls, total, self) of the called entry points, most
+    expensive first."""
+    rows = [(name, stats[0], stats[1], stats[2])
+            for name, stats in libclang_profile.items() if stats[0] > 0]
+    rows.sort(key=lambda row: row[3], reverse=True)
+    return rows
+
+def add_libclang_profile(rows):
+    """Add rows returned by get_libclang_profile(), e.g. in another process,
+    to the counters."""
+    for name, calls, total, self_time in rows:
+        stats = libclang_profile.setdefault(name, [0, 0.0, 0.0])
+        stats[0] += calls
+        stats[1] += total
+        stats[2] += self_time
+
+def reset_libclang_profile():
+    for stats in libclang_profile.values():
+        stats[0] = 0
+        stats[1] = 0.0
+        stats[2] = 0.0
+
+def format_libclang_profile(limit=None):
+    rows = get_libclang_profile()
+    if limit is not None:
+        rows = rows[:limit]
+    lines = ['%-45s %10s %12s %12s %10s' % ('function', 'calls', 'total ms',
+                                           'self ms', 'self us/call')]
+    for name, calls, total, self_time in rows:
+        lines.append('%-45s %10d %12.3f %12.3f %10.3f' % (
+            name, calls, total * 1000, self_time * 1000,
+            self_time * 1e6 / calls))
+    return '\n'.join(lines)
+
 def register_functions(lib, ignore_errors):
     """Register function prototypes with a libclang library instance.
 
@@ -4095,6 +4295,7 @@ class Config:
     library_file = None
     compatibility_check = True
     loaded = False
+    profiling = False
 
     @staticmethod
     def set_library_path(path):
@@ -4138,6 +4339,27 @@ class Config:
 
         Config.compatibility_check = check_status
 
+    @staticmethod
+    def set_profiling(enabled=True):
+        """Count the calls of every libclang function and time them.
+
+        The counters are read with get_libclang_profile(). Profiling adds a
+        Python call per libclang call, it is meant for finding out which
+        patterns hammer the library. It can be enabled after the library is
+        loaded, but not disabled anymore.
+        """
+        if Config.loaded and enabled and not Config.profiling:
+            lib = conf.lib
+            for item in functionList:
+                func = getattr(lib, item[0], None)
+                if func is not None and not isinstance(func, _ProfiledFunction):
+                    setattr(lib, item[0], _ProfiledFunction(item[0], func))
+        elif Config.loaded and not enabled and Config.profiling:
+            raise Exception("profiling can't be disabled after using " \
+                            "any other functionalities in libclang.")
+
+        Config.profiling = enabled
+
     @CachedProperty
     def lib(self):
         lib = self.get_cindex_library()
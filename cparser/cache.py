@@ -0,0 +1,252 @@
+import os
+import sys
+import hashlib
+import cPickle as pickle
+from clang import cindex
+from log import CACHE
+
+# bump when the pickled model layout changes
+CACHE_VERSION = 6
+
+
+class ModelCache(object):
+    """
+    content addressed cache of the classes and methods extracted from a file.
+
+    an entry is keyed by the main file content, the clang args and the libclang
+    version. it also records the digest of every included file, so editing a
+    header invalidates the entries of all files including it.
+    """
+
+    def __init__(self, cache_dir, clang_version=""):
+        self.cache_dir = cache_dir
+        self.clang_version = clang_version
+        # path -> (mtime, size, digest), files are hashed once per process
+        self._digests = {}
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def file_digest(self, file_path):
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+
+        cached = self._digests.get(file_path)
+        if cached is not None and cached[0] == st.st_mtime and cached[1] == st.st_size:
+            return cached[2]
+
+        with open(file_path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        self._digests[file_path] = (st.st_mtime, st.st_size, digest)
+        return digest
+
+    def _entry_path(self, file_path, clang_args, options):
+        main_digest = self.file_digest(file_path)
+        if main_digest is None:
+            return None
+
+        h = hashlib.sha1()
+        h.update("%d\0%s\0%s\0%s\0%d\0" % (CACHE_VERSION, self.clang_version, os.path.abspath(file_path),
+                                           main_digest, options))
+        for clang_arg in clang_args:
+            h.update(clang_arg)
+            h.update("\0")
+        return os.path.join(self.cache_dir, h.hexdigest() + ".model")
+
+    def load(self, file_path, clang_args, options=0):
+        """
+        return the cached (classes, methods, included paths) of the file, or None on a miss
+        """
+        entry_path = self._entry_path(file_path, clang_args, options)
+        if entry_path is None or not os.path.exists(entry_path):
+            if CACHE.debug_enabled:
+                CACHE.debug("model miss %s: no entry", file_path, file=file_path, reason="missing")
+            return None
+
+        try:
+            with open(entry_path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            # a truncated or incompatible entry is just a miss
+            if CACHE.debug_enabled:
+                CACHE.debug("model miss %s: unreadable entry", file_path, file=file_path, reason="unreadable")
+            return None
+
+        for include_path, digest in entry['includes']:
+            if self.file_digest(include_path) != digest:
+                if CACHE.debug_enabled:
+                    CACHE.debug("model miss %s: %s changed", file_path, include_path, file=file_path,
+                                reason="changed", changed=include_path)
+                return None
+
+        if CACHE.debug_enabled:
+            CACHE.debug("model hit %s", file_path, file=file_path)
+        return entry['classes'], entry['methods'], [include_path for include_path, digest in entry['includes']]
+
+    def store(self, file_path, clang_args, tu, classes, methods, options=0):
+        """
+        store the detached classes and methods extracted from the translation unit
+        """
+        entry_path = self._entry_path(file_path, clang_args, options)
+        if entry_path is None:
+            return
+
+        include_paths = set(inclusion.include.name for inclusion in tu.get_includes())
+        # files pulled in by a precompiled header are not reported by get_includes
+        include_paths.update(get_forced_includes(clang_args))
+        includes = []
+        for include_path in include_paths:
+            digest = self.file_digest(include_path)
+            if digest is not None:
+                includes.append((include_path, digest))
+
+        entry = {
+            'includes': includes,
+            'classes': classes,
+            'methods': methods
+        }
+
+        _write_pickle(entry_path, entry)
+        if CACHE.debug_enabled:
+            CACHE.debug("model store %s", file_path, file=file_path, includes=len(includes))
+
+
+class AstCache(object):
+    """
+    cache of serialized translation units (.ast files) saved by TranslationUnit.save.
+
+    a saved unit is reused while the clang args match and none of the files it
+    was built from have been modified since.
+    """
+
+    def __init__(self, cache_dir, clang_version=""):
+        self.cache_dir = cache_dir
+        self.clang_version = clang_version
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry_path(self, file_path, clang_args, options):
+        h = hashlib.sha1()
+        # the file names recorded in the unit are the ones passed to clang
+        h.update("%s\0%s\0%s\0%d\0" % (self.clang_version, os.path.abspath(file_path), file_path, options))
+        for clang_arg in clang_args:
+            h.update(clang_arg)
+            h.update("\0")
+        return os.path.join(self.cache_dir, h.hexdigest())
+
+    def ast_path(self, file_path, clang_args, options=0):
+        return self._entry_path(file_path, clang_args, options) + ".ast"
+
+    def is_valid(self, file_path, clang_args, options=0):
+        """
+        check whether the saved translation unit of the file is up to date
+        """
+        entry_path = self._entry_path(file_path, clang_args, options)
+        deps_path = entry_path + ".deps"
+        if not os.path.exists(entry_path + ".ast") or not os.path.exists(deps_path):
+            if CACHE.debug_enabled:
+                CACHE.debug("ast miss %s: no entry", file_path, file=file_path, reason="missing")
+            return False
+
+        try:
+            with open(deps_path, 'rb') as f:
+                deps = pickle.load(f)
+        except Exception:
+            if CACHE.debug_enabled:
+                CACHE.debug("ast miss %s: unreadable deps", file_path, file=file_path, reason="unreadable")
+            return False
+
+        if deps['clang_args'] != list(clang_args):
+            if CACHE.debug_enabled:
+                CACHE.debug("ast miss %s: other clang args", file_path, file=file_path, reason="args")
+            return False
+
+        for dep_path, mtime in deps['files']:
+            try:
+                changed = os.path.getmtime(dep_path) != mtime
+            except OSError:
+                changed = True
+            if changed:
+                if CACHE.debug_enabled:
+                    CACHE.debug("ast miss %s: %s changed", file_path, dep_path, file=file_path,
+                                reason="changed", changed=dep_path)
+                return False
+        return True
+
+    def load(self, index, file_path, clang_args, options=0):
+        """
+        return the saved translation unit of the file, or None if it is missing or stale
+        """
+        if not self.is_valid(file_path, clang_args, options):
+            return None
+
+        try:
+            tu = index.read(self.ast_path(file_path, clang_args, options))
+        except cindex.TranslationUnitLoadError:
+            if CACHE.debug_enabled:
+                CACHE.debug("ast miss %s: unreadable unit", file_path, file=file_path, reason="unreadable")
+            return None
+        if CACHE.debug_enabled:
+            CACHE.debug("ast hit %s", file_path, file=file_path)
+        return tu
+
+    def store(self, tu, file_path, clang_args, options=0):
+        entry_path = self._entry_path(file_path, clang_args, options)
+        ast_path = entry_path + ".ast"
+        deps_path = entry_path + ".deps"
+
+        dep_paths = set(inclusion.include.name for inclusion in tu.get_includes())
+        dep_paths.update(get_forced_includes(clang_args))
+        dep_paths.add(file_path)
+        files = []
+        for dep_path in dep_paths:
+            dep_path = os.path.abspath(dep_path)
+            try:
+                files.append((dep_path, os.path.getmtime(dep_path)))
+            except OSError:
+                # an unsaved or vanished file, the unit can't be validated later
+                return
+
+        tmp_path = "%s.%d.tmp" % (ast_path, os.getpid())
+        try:
+            tu.save(tmp_path)
+        except cindex.TranslationUnitSaveError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        _replace(tmp_path, ast_path)
+
+        deps = {
+            'clang_args': list(clang_args),
+            'files': files
+        }
+        _write_pickle(deps_path, deps)
+        if CACHE.debug_enabled:
+            CACHE.debug("ast store %s", file_path, file=file_path, files=len(files))
+
+
+def get_forced_includes(clang_args):
+    """
+    return the files passed through -include or -include-pch
+    """
+    paths = []
+    for i in range(len(clang_args) - 1):
+        if clang_args[i] == '-include' or clang_args[i] == '-include-pch':
+            paths.append(clang_args[i + 1])
+    return paths
+
+
+def _replace(src, dst):
+    if sys.platform == 'win32' and os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _write_pickle(path, obj):
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+    _replace(tmp_path, path)
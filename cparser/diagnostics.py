@@ -0,0 +1,147 @@
+from clang import cindex
+
+severity_names = ['ignored', 'note', 'warning', 'error', 'fatal']
+
+
+def get_severity(name):
+    """
+    the severity of a name like "warning", or of a number
+    """
+    if isinstance(name, basestring):
+        return severity_names.index(name.lower())
+    return int(name)
+
+
+class DiagnosticInfo(object):
+    """
+    a diagnostic copied out of libclang
+    """
+    __slots__ = ('severity', 'category', 'file', 'line', 'column', 'message', 'option')
+
+    def __init__(self, severity, category, file, line, column, message, option):
+        self.severity = severity
+        self.category = category
+        self.file = file
+        self.line = line
+        self.column = column
+        self.message = message
+        self.option = option
+
+    @property
+    def is_error(self):
+        return self.severity >= cindex.Diagnostic.Error
+
+    @property
+    def severity_name(self):
+        return severity_names[self.severity]
+
+    def to_dict(self):
+        return {
+            'severity': self.severity_name,
+            'category': self.category,
+            'file': self.file,
+            'line': self.line,
+            'column': self.column,
+            'message': self.message,
+            'option': self.option
+        }
+
+    def __str__(self):
+        return "%s:%d:%d: %s: %s" % (self.file or "<unknown>", self.line, self.column, self.severity_name,
+                                     self.message)
+
+
+class DiagnosticReport(object):
+    def __init__(self):
+        self.diagnostics = []
+        self.has_errors = False
+        # diagnostics skipped because their category reached its limit, by category
+        self.suppressed = {}
+        self.duplicates = 0
+        # the collection stopped at the error limit, later diagnostics are not counted
+        self.truncated = False
+
+
+class ParseError(Exception):
+    """
+    the translation unit of a file has errors, diagnostics holds the collected ones
+    """
+
+    def __init__(self, file_path, diagnostics, title="Fatal error in parsing headers"):
+        errors = [d for d in diagnostics if d.is_error]
+        if errors:
+            message = "%s: %s (%d errors, first: %s)" % (title, file_path, len(errors), errors[0])
+        else:
+            message = "%s: %s" % (title, file_path)
+        super(ParseError, self).__init__(message)
+        self.file_path = file_path
+        self.diagnostics = diagnostics
+        self._title = title
+
+    def __reduce__(self):
+        # rebuilt from the constructor args, so the error passes back from the workers
+        return ParseError, (self.file_path, self.diagnostics, self._title)
+
+    def to_dicts(self):
+        return [d.to_dict() for d in self.diagnostics]
+
+
+class DiagnosticCollector(object):
+    """
+    collect the diagnostics of a translation unit in a single pass.
+
+    diagnostics below min_severity are skipped without being copied, at most
+    category_limit diagnostics are kept per category, the same (file, line,
+    message) is kept once, and the pass stops once error_limit errors are kept.
+    """
+
+    def __init__(self, min_severity=cindex.Diagnostic.Error, category_limit=20, error_limit=50):
+        self.min_severity = get_severity(min_severity)
+        self.category_limit = category_limit
+        self.error_limit = error_limit
+
+    def collect(self, tu):
+        report = DiagnosticReport()
+        diagnostics = tu.diagnostics
+        count = len(diagnostics)
+        if count == 0:
+            return report
+
+        category_counts = {}
+        seen = set()
+        error_count = 0
+        for i in xrange(count):
+            d = diagnostics[i]
+            severity = d.severity
+            is_error = severity >= cindex.Diagnostic.Error
+            if is_error:
+                report.has_errors = True
+            if severity < self.min_severity:
+                continue
+
+            category = d.category_number
+            category_count = category_counts.get(category, 0)
+            if self.category_limit is not None and category_count >= self.category_limit:
+                category_name = d.category_name
+                report.suppressed[category_name] = report.suppressed.get(category_name, 0) + 1
+                continue
+
+            location = d.location
+            location_file = location.file
+            file_name = location_file.name if location_file else None
+            message = d.spelling
+            key = (file_name, location.line, message)
+            if key in seen:
+                report.duplicates += 1
+                continue
+            seen.add(key)
+
+            category_counts[category] = category_count + 1
+            report.diagnostics.append(DiagnosticInfo(severity, d.category_name, file_name, location.line,
+                                                     location.column, message, d.option))
+            if is_error:
+                error_count += 1
+                if self.error_limit is not None and error_count >= self.error_limit:
+                    report.truncated = i + 1 < count
+                    break
+        return report
@@ -1,9 +1,61 @@
 from clang import cindex
 import re
+import copy
 import utils
+from log import TRAVERSE
+
+# cursor kind -> count of the class members traversed, set while collecting stats
+cursor_kind_counts = None
+
+
+class TypeCache(object):
+    """
+    TypeInfo instances shared by every occurrence of the same type.
+    a type is identified by its kind, spelling and declaration usr, pointers
+    and references by the identity of their pointee.
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.hits = 0
+        self.misses = 0
+        # types added since the last detach
+        self._attached = []
+
+    @staticmethod
+    def get_key(type_cursor):
+        kind = type_cursor.kind
+        if kind == cindex.TypeKind.POINTER or kind == cindex.TypeKind.LVALUEREFERENCE:
+            return kind.value, TypeCache.get_key(type_cursor.get_pointee())
+        return kind.value, type_cursor.spelling, type_cursor.get_declaration().get_usr()
+
+    def add(self, key, nt):
+        self.types[key] = nt
+        self._attached.append(nt)
+
+    def clear(self):
+        self.types = {}
+        self._attached = []
+
+    def detach(self):
+        """
+        keep the types but drop their libclang handles, so they can be shared
+        with the next translation unit
+        """
+        for nt in self._attached:
+            nt.detach()
+        self._attached = []
 
 
 class TypeInfo(object):
+    # the models are created in large numbers, keep them compact
+    __slots__ = ('cursor', 'is_object', 'is_function', 'is_enum', 'is_numeric', 'is_const', 'is_pointer',
+                 'not_supported', 'param_types', 'ret_type', 'fullname', 'namespace_name', 'name', 'whole_name',
+                 'canonical_type')
+
+    # shared instances returned by from_type, they must not be changed
+    type_cache = TypeCache()
+
     def __init__(self, cursor=None):
         self.cursor = cursor
         self.is_object = False
@@ -23,8 +75,24 @@ class TypeInfo(object):
 
     @staticmethod
     def from_type(type_cursor):
+        """
+        return the shared TypeInfo of the type, use copy() before changing it
+        """
+        cache = TypeInfo.type_cache
+        key = TypeCache.get_key(type_cursor)
+        nt = cache.types.get(key)
+        if nt is None:
+            cache.misses += 1
+            nt = TypeInfo._from_type(type_cursor)
+            cache.add(key, nt)
+        else:
+            cache.hits += 1
+        return nt
+
+    @staticmethod
+    def _from_type(type_cursor):
         if type_cursor.kind == cindex.TypeKind.POINTER:
-            nt = TypeInfo.from_type(type_cursor.get_pointee())
+            nt = TypeInfo.from_type(type_cursor.get_pointee()).copy()
 
             if None != nt.canonical_type:
                 nt.canonical_type.name += "*"
@@ -40,7 +108,7 @@ class TypeInfo(object):
             if nt.is_const:
                 nt.whole_name = "const " + nt.whole_name
         elif type_cursor.kind == cindex.TypeKind.LVALUEREFERENCE:
-            nt = TypeInfo.from_type(type_cursor.get_pointee())
+            nt = TypeInfo.from_type(type_cursor.get_pointee()).copy()
             nt.is_const = type_cursor.get_pointee().is_const_qualified()
             nt.whole_name = nt.whole_name + "&"
 
@@ -96,6 +164,7 @@ class TypeInfo(object):
                         ret = TypeInfo.from_type(type_cursor.get_canonical())
                         if ret.name != "":
                             if decl.kind == cindex.CursorKind.TYPEDEF_DECL:
+                                ret = ret.copy()
                                 ret.canonical_type = nt
                             return ret
 
@@ -135,6 +204,28 @@ class TypeInfo(object):
         nt.is_object = True
         return nt
 
+    def copy(self):
+        """
+        return a copy which can be changed without affecting the shared instance
+        """
+        nt = copy.copy(self)
+        nt.param_types = list(self.param_types)
+        if self.canonical_type is not None:
+            nt.canonical_type = copy.copy(self.canonical_type)
+        return nt
+
+    def detach(self):
+        """
+        drop the libclang handles so the type can outlive its translation unit
+        """
+        self.cursor = None
+        if self.canonical_type is not None:
+            self.canonical_type.detach()
+        if self.ret_type is not None:
+            self.ret_type.detach()
+        for param_type in self.param_types:
+            param_type.detach()
+
     @property
     def lambda_parameters(self):
         params = ["%s larg%d" % (str(nt), i) for i, nt in enumerate(self.param_types)]
@@ -155,7 +246,43 @@ class FieldAttributes(object):
     Static = 16
 
 
+class LocationInfo(object):
+    """
+    the file, line and column of a source location, kept once the cursor is detached
+    """
+    __slots__ = ('file_name', 'line', 'column')
+
+    def __init__(self, file_name, line, column):
+        self.file_name = file_name
+        self.line = line
+        self.column = column
+
+    @staticmethod
+    def from_location(location):
+        """
+        copy a cindex.SourceLocation, None if it has no file
+        """
+        if location is None or isinstance(location, LocationInfo):
+            return location
+        location_file = location.file
+        if location_file is None:
+            return None
+        return LocationInfo(location_file.name, location.line, location.column)
+
+    def __eq__(self, other):
+        return isinstance(other, LocationInfo) and self.file_name == other.file_name \
+            and self.line == other.line and self.column == other.column
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return "%s:%d:%d" % (self.file_name, self.line, self.column)
+
+
 class FieldInfo(object):
+    __slots__ = ('cursor', 'name', 'kind', 'location', 'signature_name', 'field_type', 'attributes')
+
     def __init__(self, cursor):
         cursor = cursor.canonical
         self.cursor = cursor
@@ -174,6 +301,11 @@ class FieldInfo(object):
         elif self.cursor.access_specifier == cindex.AccessSpecifier.PUBLIC:
             self.set_attribute(FieldAttributes.Public)
 
+    def detach(self):
+        self.cursor = None
+        self.location = LocationInfo.from_location(self.location)
+        self.field_type.detach()
+
     def set_attribute(self, value):
         if value > FieldAttributes.BaseAttributeEnd:
             self.attributes = self.attributes | value
@@ -220,7 +352,23 @@ class FunctionAttributes(object):
     Implement = 1024
 
 
+# the tokens starting a function body or the constructor initializers before it
+_body_start_tokens = frozenset(['{', ':', 'try'])
+
+# the methods of an implementation have a body
+_objc_implementation_kinds = frozenset([cindex.CursorKind.OBJC_IMPLEMENTATION_DECL,
+                                        cindex.CursorKind.OBJC_CATEGORY_IMPL_DECL])
+
+
 class FunctionInfo(object):
+    __slots__ = ('cursor', 'func_name', 'signature_name', 'arguments', 'argumentTips', 'implementations',
+                 'is_overloaded', 'is_constructor', 'not_supported', 'is_override', 'ret_type', 'comment',
+                 'attributes', 'class_name', 'min_args', 'namespace_name', 'file_path', 'usr',
+                 '_extent_start_line', '_extent_end_line', '_location')
+
+    # set by the parser for the translation units parsed with PARSE_SKIP_FUNCTION_BODIES
+    skipped_bodies = False
+
     def __init__(self, cursor):
         self.cursor = cursor
         self.func_name = cursor.spelling
@@ -236,6 +384,13 @@ class FunctionInfo(object):
         self.comment = self.get_comment(cursor.raw_comment)
         self.attributes = FunctionAttributes.Empty
         self.class_name = None
+        self.namespace_name = utils.get_namespace_name(cursor)
+        # the parsed file which declares the function, set by the parser
+        self.file_path = None
+        self.usr = cursor.get_usr()
+        self._extent_start_line = -1
+        self._extent_end_line = -1
+        self._location = None
 
         self._parse()
 
@@ -294,13 +449,26 @@ class FunctionInfo(object):
             self.set_attribute(FunctionAttributes.Implement)
 
     def _check_have_implement(self):
-        have_implement = False
+        # most functions in headers are only declared, don't visit their children
+        if not self.cursor.is_definition():
+            return FunctionInfo.skipped_bodies and self._has_skipped_body()
 
         for node in self.cursor.get_children():
             if node.kind == cindex.CursorKind.COMPOUND_STMT:
-                have_implement = True
-                break
-        return have_implement
+                return True
+
+        # a definition without a body statement has its body skipped
+        # (PARSE_SKIP_FUNCTION_BODIES), unless it is defaulted or deleted
+        if self.cursor.is_default_method():
+            return False
+        return self.cursor.availability != cindex.AvailabilityKind.NOT_AVAILABLE
+
+    def _has_skipped_body(self):
+        # libclang reports a function whose body was skipped as a declaration ending
+        # before the body, tell them apart by the token following the declaration
+        if self.cursor.lexical_parent.kind in _objc_implementation_kinds:
+            return True
+        return utils.get_token_after(self.cursor) in _body_start_tokens
 
     def get_comment(self, comment):
         replace_str = comment
@@ -330,6 +498,20 @@ class FunctionInfo(object):
 
         return replace_str
 
+    def detach(self):
+        """
+        copy out the extent data and drop the libclang handles
+        """
+        if self.cursor is not None:
+            extent = self.cursor.extent
+            self._extent_start_line = extent.start.line
+            self._extent_end_line = extent.end.line
+            self._location = LocationInfo.from_location(self.cursor.location)
+            self.cursor = None
+        self.ret_type.detach()
+        for arg in self.arguments:
+            arg.detach()
+
     def set_attribute(self, value):
         if value > FunctionAttributes.BaseAttributeEnd:
             self.attributes = self.attributes | value
@@ -374,7 +556,7 @@ class FunctionInfo(object):
         if self.cursor is not None:
             return self.cursor.extent.start.line
         else:
-            return -1
+            return self._extent_start_line
 
     def get_extent_end(self):
         if self.cursor is not None:
@@ -386,11 +568,25 @@ class FunctionInfo(object):
         if self.cursor is not None:
             return self.cursor.extent.end.line
         else:
-            return -1
+            return self._extent_end_line
+
+    def get_location(self):
+        """
+        the LocationInfo of the declaration
+        """
+        if self.cursor is not None:
+            return LocationInfo.from_location(self.cursor.location)
+        else:
+            return self._location
 
 
 class ClassInfo(object):
-    def __init__(self, cursor):
+    __slots__ = ('cursor', 'class_name', 'is_ref_class', 'full_class_name', 'parents', 'fields', 'public_fields',
+                 'static_fields', 'methods', 'is_abstract', '_current_visibility', 'override_methods',
+                 'has_constructor', 'namespace_name', 'file_path', 'usr', 'line', 'bases', 'is_placeholder',
+                 '_location', '_registry', 'generator')
+
+    def __init__(self, cursor, registry=None):
         # the cursor to the implementation
         self.cursor = cursor
         self.class_name = cursor.displayname
@@ -407,12 +603,62 @@ class ClassInfo(object):
         self.override_methods = {}
         self.has_constructor = False
         self.namespace_name = ""
+        # the parsed file which declares the class, set by the parser
+        self.file_path = None
+        self.usr = cursor.get_usr()
+        self.line = cursor.location.line
+        # (name, full name, usr) of the direct base classes
+        self.bases = []
+        self.is_placeholder = False
+        self._location = None
 
         self.full_class_name = utils.get_fullname(cursor)
         self.namespace_name = utils.get_namespace_name(cursor)
 
+        # links the parents while parsing and memoizes the facts about them, see ClassRegistry
+        self._registry = registry
+        if registry is not None:
+            registry.add(self)
         self._parse()
 
+    @staticmethod
+    def placeholder(name, full_name, usr):
+        """
+        a class only known by its names, standing for a base class which is not parsed
+        """
+        nclass = ClassInfo.__new__(ClassInfo)
+        nclass.cursor = None
+        nclass.class_name = name
+        nclass.is_ref_class = name == "Ref"
+        nclass.full_class_name = full_name
+        nclass.parents = []
+        nclass.fields = []
+        nclass.public_fields = []
+        nclass.static_fields = []
+        nclass.methods = []
+        nclass.is_abstract = False
+        nclass._current_visibility = cindex.AccessSpecifier.PRIVATE
+        nclass.override_methods = {}
+        nclass.has_constructor = False
+        nclass.namespace_name = ""
+        nclass.file_path = None
+        nclass.usr = usr
+        nclass.line = -1
+        nclass.bases = []
+        nclass.is_placeholder = True
+        nclass._location = None
+        nclass._registry = None
+        return nclass
+
+    def get_location(self):
+        """
+        the LocationInfo of the declaration, None for a placeholder
+        """
+        if self.cursor is not None:
+            return LocationInfo.from_location(self.cursor.location)
+        else:
+            return self._location
+
     @property
     def underlined_class_name(self):
         return self.full_class_name.replace("::", "_")
@@ -422,9 +668,28 @@ class ClassInfo(object):
         parse the current cursor, getting all the necesary information
         """
         # the root cursor is CLASS_DECL.
+        counts = cursor_kind_counts
         for cursor in self.cursor.get_children():
+            if counts is not None:
+                counts[cursor.kind] += 1
             self._traverse(cursor)
 
+    def detach(self):
+        """
+        drop the libclang handles of the class and everything it owns
+        """
+        if self.cursor is not None:
+            self._location = LocationInfo.from_location(self.cursor.location)
+            self.cursor = None
+        for field in self.fields:
+            field.detach()
+        for field in self.public_fields:
+            field.detach()
+        for field in self.static_fields:
+            field.detach()
+        for method in self.methods:
+            method.detach()
+
     def methods_clean(self):
         """
         clean list of methods (without the ones that should be skipped)
@@ -455,21 +720,18 @@ class ClassInfo(object):
     def _traverse(self, cursor=None, depth=0):
         if cursor.kind == cindex.CursorKind.CXX_BASE_SPECIFIER:
             parent = cursor.get_definition()
+            if parent is None:
+                # the base class is only declared
+                parent = cursor.type.get_declaration()
             parent_name = parent.displayname
+            base = (parent_name, utils.get_fullname(parent), parent.get_usr())
+            self.bases.append(base)
+
+            if self._registry is not None:
+                self._registry.link_base(self, base, cursor.get_definition(), ClassInfo)
 
-            # if not self.class_name in self.generator.classes_have_no_parents:
-            #     if parent_name and parent_name not in self.generator.base_classes_to_skip:
-            #         # if parent and self.generator.in_listed_classes(parent.displayname):
-            #         if not self.generator.parsed_classes.has_key(parent.displayname):
-            #             parent = NativeClass(parent, self.generator)
-            #             self.generator.parsed_classes[parent.class_name] = parent
-            #         else:
-            #             parent = self.generator.parsed_classes[parent.displayname]
-            #
-            #         self.parents.append(parent)
-            #
-            # if parent_name == "Ref":
-            #     self.is_ref_class = True
+            if parent_name == "Ref":
+                self.is_ref_class = True
 
         elif cursor.kind == cindex.CursorKind.FIELD_DECL:
             self.fields.append(FieldInfo(cursor))
@@ -506,36 +768,31 @@ class ClassInfo(object):
         # else:
         #     print "unknown cursor: %s - %s" % (cursor.kind, cursor.displayname)
 
+    def _get_registry(self):
+        # a class outside of a registry gets the facts computed again on each call
+        return self._registry if self._registry is not None else ClassRegistry()
+
     @staticmethod
     def _is_method_in_parents(current_class, method_name):
-        if len(current_class.parents) > 0:
-            if method_name in current_class.parents[0].methods:
-                return True
-            return ClassInfo._is_method_in_parents(current_class.parents[0], method_name)
-        return False
+        return method_name in current_class._get_registry().inherited_method_names(current_class)
 
     def _is_ref_class(self, depth=0):
         """
         Mark the class as 'cocos2d::Ref' or its subclass.
         """
-        # print ">" * (depth + 1) + " " + self.class_name
-
-        for parent in self.parents:
-            if parent._is_ref_class(depth + 1):
-                return True
-
-        if self.is_ref_class:
-            return True
-
-        return False
+        return self._get_registry().is_ref_class(self)
 
 
 class NamespaceInfo(object):
+    __slots__ = ('cursor',)
+
     def __init__(self, cursor):
         self.cursor = cursor
 
 
 class ObjcProperty(object):
+    __slots__ = ('cursor', 'name', 'kind', 'location', 'signature_name', 'field_type')
+
     def __init__(self, cursor):
         self.cursor = cursor
         self.name = cursor.displayname
@@ -545,14 +802,26 @@ class ObjcProperty(object):
         self.signature_name = self.name
         self.field_type = TypeInfo.from_type(cursor.type)
 
+    def detach(self):
+        self.cursor = None
+        self.location = LocationInfo.from_location(self.location)
+        self.field_type.detach()
+
 
 class ObjcClassInfo(ClassInfo):
-    def __init__(self, cursor):
+    __slots__ = ('properties', 'is_category', 'associated_class', 'associated_class_displayname')
+
+    def __init__(self, cursor, registry=None):
         self.properties = []
         self.is_category = False
         self.associated_class = None
         self.associated_class_displayname = None
-        super(ObjcClassInfo, self).__init__(cursor)
+        super(ObjcClassInfo, self).__init__(cursor, registry)
+
+    def detach(self):
+        super(ObjcClassInfo, self).detach()
+        for p in self.properties:
+            p.detach()
 
     def _traverse(self, cursor=None, depth=0):
         super(ObjcClassInfo, self)._traverse(cursor, depth)
@@ -567,10 +836,179 @@ class ObjcClassInfo(ClassInfo):
             m.set_attribute(FunctionAttributes.Static)
             self.methods.append(m)
         elif cursor.kind == cindex.CursorKind.OBJC_PROPERTY_DECL:
-            print("do nothing OBJC_PROPERTY_DECL")
+            if TRAVERSE.debug_enabled:
+                TRAVERSE.debug("find OBJC_PROPERTY_DECL %s", cursor.displayname)
             p = ObjcProperty(cursor)
             self.properties.append(p)
         elif cursor.kind == cindex.CursorKind.OBJC_CLASS_REF:
             self.associated_class_displayname = cursor.displayname
-        else:
-            print "unknown cursor: %s - %s" % (cursor.kind, cursor.displayname)
+        elif cursor.kind == cindex.CursorKind.OBJC_SUPER_CLASS_REF:
+            superclass = cursor.referenced
+            base = (cursor.displayname, cursor.displayname, superclass.get_usr() if superclass is not None else None)
+            self.bases.append(base)
+            if self._registry is not None:
+                self._registry.link_base(self, base, superclass, ObjcClassInfo)
+        elif TRAVERSE.debug_enabled:
+            TRAVERSE.debug("unknown cursor: %s - %s", cursor.kind, cursor.displayname)
+
+
+class ClassRegistry(object):
+    """
+    the classes of every translation unit by usr, used to fill ClassInfo.parents.
+
+    a base class which is not registered yet is created from its definition, or
+    linked to a placeholder when the definition is not available. the parents
+    are relinked whenever the class of their usr is registered later.
+
+    the registry is local to a process, pickled classes take an empty one along
+    until the parser receiving them merges them into its own.
+    """
+
+    def __init__(self):
+        self.classes = {}
+        # usr -> {(id(class), parent index): class} of every class linked to that usr
+        self._links = {}
+        self._placeholders = {}
+        # classes added since the last detach
+        self._attached = []
+        # memoized facts derived from the inheritance graph, id(class) -> (class, fact)
+        self._ref_classes = {}
+        self._inherited_methods = {}
+
+    def __reduce__(self):
+        return ClassRegistry, ()
+
+    def get(self, usr):
+        return self.classes.get(usr)
+
+    def add(self, nclass):
+        nclass._registry = self
+        if not nclass.usr:
+            return
+        self.classes[nclass.usr] = nclass
+        if nclass.cursor is not None:
+            self._attached.append(nclass)
+
+        links = self._links.get(nclass.usr)
+        if links:
+            for (child_id, index), child in links.iteritems():
+                child.parents[index] = nclass
+            self._placeholders.pop(nclass.usr, None)
+            self._clear_facts()
+
+    def remove(self, nclass):
+        """
+        forget the class and the links of its parents, the classes deriving from
+        it keep their links and get the class registered next under its usr
+        """
+        for i, parent in enumerate(nclass.parents):
+            links = self._links.get(parent.usr) if parent.usr else None
+            if links:
+                links.pop((id(nclass), i), None)
+                if not links:
+                    del self._links[parent.usr]
+        if nclass.usr and self.classes.get(nclass.usr) is nclass:
+            del self.classes[nclass.usr]
+        self._clear_facts()
+
+    def _link(self, usr, nclass, index):
+        # merging a class again must not add its links twice
+        self._links.setdefault(usr, {})[(id(nclass), index)] = nclass
+
+    def link_base(self, nclass, base, definition, class_type):
+        """
+        append the class of a (name, full name, usr) base to the parents of nclass.
+        definition is the cursor to the base definition, or None
+        """
+        name, full_name, usr = base
+        parent = self.classes.get(usr) if usr else None
+        if parent is None and definition is not None:
+            # registers itself and its own bases
+            parent = class_type(definition, self)
+        if parent is None:
+            parent = self._placeholders.get(usr) if usr else None
+            if parent is None:
+                parent = ClassInfo.placeholder(name, full_name, usr)
+                if usr:
+                    self._placeholders[usr] = parent
+
+        if usr:
+            self._link(usr, nclass, len(nclass.parents))
+        nclass.parents.append(parent)
+
+    def merge(self, nclass):
+        """
+        register a class built by another parser, e.g. in a worker process or
+        loaded from the cache, and share the parents already registered
+        """
+        known = self.classes.get(nclass.usr) if nclass.usr else None
+        if known is not None and known is not nclass:
+            return known
+        if not nclass.is_placeholder:
+            self.add(nclass)
+
+        for i, parent in enumerate(nclass.parents):
+            usr = parent.usr
+            if usr:
+                self._link(usr, nclass, i)
+            known = self.classes.get(usr) if usr else None
+            if known is None and usr:
+                known = self._placeholders.get(usr)
+            if known is not None:
+                nclass.parents[i] = known
+            elif parent.is_placeholder:
+                if usr:
+                    self._placeholders[usr] = parent
+            else:
+                self.merge(parent)
+        self._clear_facts()
+        return nclass
+
+    def detach(self):
+        """
+        drop the libclang handles of the classes added since the last detach,
+        bases created from their definitions are not returned by the parser
+        """
+        for nclass in self._attached:
+            if nclass.cursor is not None:
+                nclass.detach()
+        self._attached = []
+
+    def _clear_facts(self):
+        if self._ref_classes:
+            self._ref_classes = {}
+        if self._inherited_methods:
+            self._inherited_methods = {}
+
+    def is_ref_class(self, nclass):
+        """
+        whether the class is cocos2d::Ref or derives from it
+        """
+        fact = self._ref_classes.get(id(nclass))
+        if fact is not None:
+            return fact[1]
+
+        is_ref = nclass.is_ref_class
+        if not is_ref:
+            for parent in nclass.parents:
+                if self.is_ref_class(parent):
+                    is_ref = True
+                    break
+        self._ref_classes[id(nclass)] = (nclass, is_ref)
+        return is_ref
+
+    def inherited_method_names(self, nclass):
+        """
+        names of the methods declared by the ancestors of the class
+        """
+        fact = self._inherited_methods.get(id(nclass))
+        if fact is not None:
+            return fact[1]
+
+        names = set()
+        for parent in nclass.parents:
+            names.update(method.func_name for method in parent.methods)
+            names.update(self.inherited_method_names(parent))
+        names = frozenset(names)
+        self._inherited_methods[id(nclass)] = (nclass, names)
+        return names
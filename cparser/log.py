@@ -0,0 +1,131 @@
+import os
+import json
+import logging
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+ROOT_NAME = "cparser"
+
+_root_logger = logging.getLogger(ROOT_NAME)
+# the library stays quiet unless the application configures logging
+_root_logger.addHandler(logging.NullHandler())
+
+_categories = {}
+
+
+class Category(object):
+    """
+    a logger with cached level checks.
+
+    the hot paths only test debug_enabled or info_enabled, an attribute read,
+    before building any message:
+
+        if TRAVERSE.debug_enabled:
+            TRAVERSE.debug("find %s", cursor.kind)
+    """
+    __slots__ = ('name', 'logger', 'debug_enabled', 'info_enabled')
+
+    def __init__(self, name):
+        self.name = name
+        self.logger = logging.getLogger(ROOT_NAME + "." + name)
+        self.set_level(WARNING)
+
+    def set_level(self, level):
+        if isinstance(level, basestring):
+            level = logging.getLevelName(level.upper())
+        self.logger.setLevel(level)
+        self.debug_enabled = self.logger.isEnabledFor(DEBUG)
+        self.info_enabled = self.logger.isEnabledFor(INFO)
+
+    def debug(self, msg, *args, **fields):
+        self.logger.debug(msg, *args, extra={'fields': fields})
+
+    def info(self, msg, *args, **fields):
+        self.logger.info(msg, *args, extra={'fields': fields})
+
+    def warning(self, msg, *args, **fields):
+        self.logger.warning(msg, *args, extra={'fields': fields})
+
+    def error(self, msg, *args, **fields):
+        self.logger.error(msg, *args, extra={'fields': fields})
+
+    def log(self, level, msg, *args, **fields):
+        self.logger.log(level, msg, *args, extra={'fields': fields})
+
+
+def get_category(name):
+    category = _categories.get(name)
+    if category is None:
+        category = Category(name)
+        _categories[name] = category
+    return category
+
+
+PARSER = get_category("parser")
+TRAVERSE = get_category("traverse")
+DIAGNOSTICS = get_category("diagnostics")
+CACHE = get_category("cache")
+
+
+class JsonTraceFormatter(logging.Formatter):
+    """
+    one json object per record, with the fields passed to the category
+    """
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'process': record.process,
+            'category': record.name[len(ROOT_NAME) + 1:],
+            'level': record.levelname,
+            'message': record.getMessage()
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        return json.dumps(entry, sort_keys=True, default=str)
+
+
+def set_levels(levels):
+    """
+    set the level of categories from a {category: level} dict, "*" sets all of them
+    """
+    default_level = levels.get("*")
+    if default_level is not None:
+        for category in _categories.itervalues():
+            category.set_level(default_level)
+    for name, level in levels.iteritems():
+        if name != "*":
+            get_category(name).set_level(level)
+
+
+def open_trace(trace_path):
+    """
+    append the records which pass the category levels to a json lines file
+    """
+    handler = logging.FileHandler(trace_path, mode='a')
+    handler.setFormatter(JsonTraceFormatter())
+    _root_logger.addHandler(handler)
+    return handler
+
+
+def close_trace(handler):
+    _root_logger.removeHandler(handler)
+    handler.close()
+
+
+def configure(opts):
+    """
+    apply the log_levels and trace_file parser opts
+    """
+    if opts.get('log_levels'):
+        set_levels(opts['log_levels'])
+    trace_file = opts.get('trace_file')
+    if trace_file:
+        for handler in _root_logger.handlers:
+            if isinstance(handler, logging.FileHandler) and handler.baseFilename == os.path.abspath(trace_file):
+                return
+        open_trace(trace_file)
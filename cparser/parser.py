@@ -1,25 +1,115 @@
 import sys
 import os
+import multiprocessing
+import tempfile
+import hashlib
+import heapq
+from itertools import islice, izip
+from collections import OrderedDict
 from infos import *
+from cache import ModelCache, AstCache, get_forced_includes
+from diagnostics import DiagnosticCollector, ParseError
+from log import PARSER, TRAVERSE, DIAGNOSTICS
+from stats import ParserStats
+import log
+import project
+import utils
 from clang import cindex
 
+# cursors whose children are traversed like top level declarations
+_container_kinds = frozenset([
+    cindex.CursorKind.NAMESPACE,
+    cindex.CursorKind.OBJC_IMPLEMENTATION_DECL,
+    cindex.CursorKind.OBJC_CATEGORY_IMPL_DECL
+])
+
 clang_lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../libclang')
 cindex.Config.set_library_path(clang_lib_path)
 
 
+def get_clang_version():
+    version_file = os.path.join(clang_lib_path, 'VERSION.txt')
+    if not os.path.exists(version_file):
+        return ""
+    with open(version_file) as f:
+        return f.read().strip()
+
+
 class Parser(object):
     def __init__(self, opts):
+        self.opts = opts
+        log.configure(opts)
+        if opts.get('profile_libclang'):
+            # counts and times every libclang call, see cindex.get_libclang_profile
+            cindex.Config.set_profiling(True)
         self.index = cindex.Index.create()
-        self.clang_args = opts['clang_args']
+        # the pch and platform args are added to a copy, opts may be shared by other parsers
+        self.clang_args = list(opts['clang_args'])
         self.skip_classes = {}
-        self.parsed_classes = {}
+        # keep insertion order so results don't depend on dict hashing
+        self.parsed_classes = OrderedDict()
         self.win32_clang_flags = opts['win32_clang_flags']
         self.methods = []
         self.namespaces = []
+        # classes by usr across translation units, links the parents of the classes
+        self.class_registry = ClassRegistry()
+
+        # per file timings and counters, see get_stats
+        self.stats = ParserStats() if opts.get('stats') else None
+
+        self.diagnostic_collector = DiagnosticCollector(opts.get('diagnostic_severity', cindex.Diagnostic.Error),
+                                                        opts.get('diagnostic_category_limit', 20),
+                                                        opts.get('diagnostic_error_limit', 50))
 
         self.current_namespace = None
         self._parsing_file = None
 
+        # translation units and their declarations kept alive by reparse_file
+        self.translation_units = {}
+        self._file_declarations = {}
+        # file -> {included file name: mtime} when its declarations were extracted
+        self._file_includes = {}
+        # file -> {included or forced included path: mtime} when iter_declarations
+        # extracted it, see get_dependencies
+        self._file_dependencies = {}
+
+        # models served from or stored into the cache are detached from libclang
+        self.model_cache = None
+        if opts.get('cache_dir'):
+            self.model_cache = ModelCache(opts['cache_dir'], get_clang_version())
+        # detached models keep the data they need and don't pin their translation unit,
+        # so at most one unit is alive at a time
+        self.detach_models = bool(opts.get('detach')) or self.model_cache is not None
+
+        # the headers under header_dirs are extracted too, each once, see _traverse_headers
+        self.header_dirs = None
+        self.header_claims = None
+        # paths of the headers whose models are merged, None in the workers where the parent merges them
+        self.placed_headers = None
+        # (included header paths, {(header path, args): (classes, methods)}) of the last parsed file
+        self._file_headers = None
+        if opts.get('header_dirs'):
+            if self.model_cache is not None:
+                # the models of a file would depend on the files parsed before it
+                raise Exception("header_dirs can't be used with cache_dir")
+            self.header_dirs = tuple(os.path.join(os.path.abspath(header_dir), '').replace("\\", "/")
+                                     for header_dir in opts['header_dirs'])
+            self.header_claims = project.HeaderClaims()
+            self.placed_headers = set()
+        # declarations are all the bindings need, so bodies can be skipped
+        self.parse_options = cindex.TranslationUnit.PARSE_NONE
+        if opts.get('skip_function_bodies'):
+            self.parse_options |= cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+        if opts.get('incomplete'):
+            self.parse_options |= cindex.TranslationUnit.PARSE_INCOMPLETE
+        if opts.get('precompiled_preamble'):
+            self.parse_options |= cindex.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+
+        # saved translation units, reused while their inputs are unchanged
+        self.ast_cache = None
+        if opts.get('ast_cache_dir'):
+            self.ast_cache = AstCache(opts['ast_cache_dir'], get_clang_version())
+
         extend_clang_args = []
 
         for clang_arg in self.clang_args:
@@ -36,6 +126,16 @@ class Parser(object):
         if sys.platform == 'win32' and self.win32_clang_flags != None:
             self.clang_args.extend(self.win32_clang_flags)
 
+        # the args without the precompiled header, parse_project builds one per set of args
+        self._base_clang_args = list(self.clang_args)
+
+        # precompile the prefix header once and include it in every parse
+        self.prefix_header = opts.get('prefix_header')
+        self.pch_dir = opts.get('pch_dir') or os.path.join(tempfile.gettempdir(), 'cparser-pch')
+        if self.prefix_header:
+            pch_path = self._build_prefix_header(self.prefix_header, self.pch_dir, self.clang_args)
+            self.clang_args.extend(['-include-pch', pch_path])
+
         # if opts['skip']:
         #     list_of_skips = re.split(",\n?", opts['skip'])
         #     for skip in list_of_skips:
@@ -57,130 +157,805 @@ class Parser(object):
 
         if source_file:
             source_file = source_file.replace("\\", "/")
-            print("%s=%s" % (source_file, parsing_file))
+            if TRAVERSE.debug_enabled:
+                TRAVERSE.debug("%s=%s", source_file, parsing_file)
             return source_file == parsing_file
         else:
             return True
 
-    def _check_diagnostics(self, diagnostics):
-        errors = []
-        for idx, d in enumerate(diagnostics):
-            if d.severity > 2:
-                errors.append(d)
-        if len(errors) == 0:
-            return
-        print("====\nErrors in parsing headers:")
-        severities = ['Ignored', 'Note', 'Warning', 'Error', 'Fatal']
-        for idx, d in enumerate(errors):
-            print "%s. <severity = %s,\n    location = %r,\n    details = %r>" % (
-                idx + 1, severities[d.severity], d.location, d.spelling)
-        print("====\n")
+    def _check_diagnostics(self, report):
+        for d in report.diagnostics:
+            DIAGNOSTICS.log(log.ERROR if d.is_error else log.WARNING, "%s", d, **d.to_dict())
+        for category, count in report.suppressed.iteritems():
+            DIAGNOSTICS.warning("%d more diagnostics in category %s", count, category or "<none>")
+        if report.truncated:
+            DIAGNOSTICS.warning("stopped at the error limit")
 
     # must read the yaml file first
     def parse_file(self, file_path):
-        tu = self.index.parse(file_path, self.clang_args)
-        if len(tu.diagnostics) > 0:
-            self._check_diagnostics(tu.diagnostics)
-            is_fatal = False
-            for d in tu.diagnostics:
-                if d.severity >= cindex.Diagnostic.Error:
-                    is_fatal = True
-            if is_fatal:
-                print("*** Found errors - can not continue")
-                raise Exception("Fatal error in parsing headers")
+        if self.stats is None:
+            self._parse_file(file_path, None)
+            return
+
+        file_stats = self.stats.begin_file(file_path)
+        class_count = len(self.parsed_classes)
+        method_count = len(self.methods)
+        self._parse_file(file_path, file_stats)
+        file_stats.finish(*self._added_since(class_count, method_count))
+
+    def _parse_file(self, file_path, file_stats):
+        if self.model_cache is not None:
+            cached = self.model_cache.load(file_path, self.clang_args, self.parse_options)
+            if cached is not None:
+                classes, methods, include_paths = cached
+                self._merge(classes, methods)
+                if file_stats is not None:
+                    file_stats.cached = True
+                    file_stats.end_phase('cache_load')
+                return
+
+        if not self.detach_models:
+            self._parse_translation_unit(file_path, file_stats)
+            return
+
+        class_count = len(self.parsed_classes)
+        method_count = len(self.methods)
+        tu = self._parse_translation_unit(file_path, file_stats)
+        classes, methods = self._added_since(class_count, method_count)
+        for class_name, nclass in classes:
+            nclass.detach()
+        for method in methods:
+            method.detach()
+        # nothing extracted from the unit refers to it anymore
+        self.class_registry.detach()
+        self._end_translation_unit()
+        if file_stats is not None:
+            file_stats.end_phase('detach')
+        if self.model_cache is not None:
+            self.model_cache.store(file_path, self.clang_args, tu, classes, methods, self.parse_options)
+            if file_stats is not None:
+                file_stats.end_phase('cache_store')
+
+    def _load_translation_unit(self, file_path):
+        if self.ast_cache is None:
+            return self.index.parse(file_path, self.clang_args, options=self.parse_options)
+
+        tu = self.ast_cache.load(self.index, file_path, self.clang_args, self.parse_options)
+        if tu is None:
+            tu = self.index.parse(file_path, self.clang_args, options=self.parse_options)
+            self.ast_cache.store(tu, file_path, self.clang_args, self.parse_options)
+        return tu
+
+    def _begin_translation_unit(self):
+        """
+        reset the caches which are only valid inside one translation unit
+        """
+        self._end_translation_unit()
+        FunctionInfo.skipped_bodies = bool(self.parse_options & cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES)
+
+    def _end_translation_unit(self):
+        """
+        drop the caches referring to the cursors of the last translation unit, in
+        detach mode before the next one is loaded so only one unit is alive at a time
+        """
+        utils.clear_name_cache()
+        if self.opts.get('share_type_cache'):
+            # usrs and spellings identify types across translation units
+            TypeInfo.type_cache.detach()
+        else:
+            TypeInfo.type_cache.clear()
+
+    def _check_translation_unit(self, tu):
+        report = self.diagnostic_collector.collect(tu)
+        self._check_diagnostics(report)
+        if report.has_errors:
+            PARSER.error("found errors in %s - can not continue", tu.spelling)
+            raise ParseError(tu.spelling, report.diagnostics)
+
+    def _build_prefix_header(self, header_path, pch_dir, clang_args):
+        """
+        build (or reuse) the precompiled header of header_path for the clang args and return its path
+        """
+        header_args = Parser._get_header_args(clang_args)
+        options = cindex.TranslationUnit.PARSE_INCOMPLETE
+        pch_cache = AstCache(pch_dir, get_clang_version())
+        if not pch_cache.is_valid(header_path, header_args, options):
+            tu = self.index.parse(header_path, header_args, options=options)
+            self._check_translation_unit(tu)
+            pch_cache.store(tu, header_path, header_args, options)
+            if not pch_cache.is_valid(header_path, header_args, options):
+                raise Exception("Failed to build precompiled header for %s" % header_path)
+        return pch_cache.ast_path(header_path, header_args, options)
+
+    @staticmethod
+    def _get_header_args(clang_args):
+        # a precompiled header must be parsed as a header of the same language
+        header_args = list(clang_args)
+        for i in range(len(header_args) - 1):
+            if header_args[i] == '-x' and not header_args[i + 1].endswith('-header'):
+                header_args[i + 1] += '-header'
+        return header_args
+
+    def _parse_translation_unit(self, file_path, file_stats=None):
+        tu = self._load_translation_unit(file_path)
+        if file_stats is not None:
+            file_stats.end_phase('parse')
+        self._check_translation_unit(tu)
+        if file_stats is not None:
+            file_stats.end_phase('diagnostics')
+        self._begin_translation_unit()
         self._parsing_file = file_path.replace("\\", "/")
 
         # the root cursor is TRANSLATION_UNIT,visitor children
-        if tu.cursor.kind == cindex.CursorKind.TRANSLATION_UNIT:
-            cd = Parser._get_children_array_from_iter(tu.cursor.get_children())
+        root = tu.cursor
+        if root.kind == cindex.CursorKind.TRANSLATION_UNIT:
+            for cursor in self._iter_declarations(tu, root):
+                if file_stats is not None:
+                    file_stats.cursor_kinds[cursor.kind] += 1
+                self._traverse_declaration(cursor)
+        if file_stats is not None:
+            file_stats.end_phase('traverse')
+        if self.header_dirs is not None:
+            self._traverse_headers(tu, file_path)
+            if file_stats is not None:
+                file_stats.end_phase('headers')
+        return tu
+
+    def _get_included_headers(self, tu, file_path):
+        """
+        (path, file handle, file name) of the headers under header_dirs which the
+        translation unit includes, in include order
+        """
+        headers = []
+        seen = set([os.path.abspath(file_path).replace("\\", "/")])
+        for inclusion in tu.get_includes():
+            header = inclusion.include
+            header_name = header.name.replace("\\", "/")
+            header_path = os.path.abspath(header_name).replace("\\", "/")
+            if header_path in seen or not header_path.startswith(self.header_dirs):
+                continue
+            seen.add(header_path)
+            headers.append((header_path, cindex._file_handle(header.obj), header_name))
+        return headers
+
+    def _traverse_headers(self, tu, file_path):
+        """
+        extract the declarations of the headers under header_dirs which the translation
+        unit includes, one header after another in include order.
+        a header is extracted by the first file claiming it with the same args, see
+        project.HeaderClaims. the workers extract every header they claim and the parent
+        keeps the ones of the first file including the header in task order, so the
+        models and their order don't depend on the scheduling, see _merge_task_results
+        """
+        headers = self._get_included_headers(tu, file_path)
+        args = tuple(self.clang_args)
+        keys = [(header_path, args) for header_path, handle, header_name in headers
+                if self.placed_headers is None or header_path not in self.placed_headers]
+        claimed = set(self.header_claims.claim(keys, file_path)) if keys else set()
+
+        extracted = OrderedDict()
+        if claimed:
+            if PARSER.info_enabled:
+                PARSER.info("extract %d headers from %s", len(claimed), file_path,
+                            headers=sorted(header_path for header_path, args in claimed))
+            # the top level cursors are matched by file handle, like the walk of the main file
+            handles = set(handle for header_path, handle, header_name in headers if (header_path, args) in claimed)
+            header_cursors = {}
             for cursor in tu.cursor.get_children():
-                self._traverse(cursor)
+                handle = cindex._cursor_file_handle(cursor)
+                if handle in handles:
+                    header_cursors.setdefault(handle, []).append(cursor)
+
+            for header_path, handle, header_name in headers:
+                key = (header_path, args)
+                if key not in claimed:
+                    continue
+                class_count = len(self.parsed_classes)
+                method_count = len(self.methods)
+                self._parsing_file = header_name
+                for cursor in header_cursors.get(handle, ()):
+                    self._traverse_declaration(cursor)
+                extracted[key] = self._added_since(class_count, method_count)
+                if self.placed_headers is not None:
+                    self.placed_headers.add(header_path)
+            self._parsing_file = file_path.replace("\\", "/")
+        self._file_headers = ([header_path for header_path, handle, header_name in headers], extracted)
+
+    def parse_files(self, file_paths, workers=None):
+        """
+        parse many files, fanning them out to a pool of worker processes.
+        results are merged in the order of file_paths
+        """
+        self._parse_tasks([(file_path, self.clang_args) for file_path in file_paths], workers)
+
+    def parse_project(self, build_dir, workers=None, file_filter=None):
+        """
+        parse the source files of the compile_commands.json in build_dir, each
+        with the args of its compile command followed by the clang_args of the parser.
+        the prefix header is precompiled once per set of args, so its pch matches
+        the files including it. files are scheduled grouped by their args, so the
+        runs of files a worker takes mostly share their args and the shared type cache.
+        file_filter is passed to project.group_compile_commands
+        """
+        groups = project.group_compile_commands(build_dir, file_filter)
+        tasks = []
+        for args, file_paths in groups.iteritems():
+            clang_args = list(args) + self._base_clang_args
+            if self.prefix_header:
+                pch_path = self._build_prefix_header(self.prefix_header, self.pch_dir, clang_args)
+                clang_args.extend(['-include-pch', pch_path])
+            for file_path in file_paths:
+                tasks.append((file_path, clang_args))
+        PARSER.info("parse %d files with %d sets of args from %s", len(tasks), len(groups), build_dir,
+                    files=len(tasks), groups=len(groups))
+        self._parse_tasks(tasks, workers)
+
+    def _parse_tasks(self, tasks, workers):
+        """
+        parse the (file path, clang args) tasks, merging the results in their order
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        workers = min(workers, len(tasks))
+
+        if workers <= 1:
+            clang_args = self.clang_args
+            try:
+                for file_path, self.clang_args in tasks:
+                    self.parse_file(file_path)
+            finally:
+                self.clang_args = clang_args
+        else:
+            manager = None
+            header_claims = None
+            if self.header_dirs is not None:
+                # the workers claim the headers through one HeaderClaims
+                manager = project.ClaimsManager()
+                manager.start()
+                header_claims = manager.HeaderClaims(self.header_claims.get_claims())
+            pool = multiprocessing.Pool(workers, _init_worker, (self.opts, self.clang_args, header_claims))
+            try:
+                # tasks sharing args stay together, each worker takes a run of them
+                chunksize = max(1, len(tasks) // (workers * 4))
+                results = pool.imap(_parse_file_in_worker, tasks, chunksize)
+                if self.header_dirs is not None:
+                    # the models of a header may come from a later file
+                    results = list(results)
+                self._merge_task_results(tasks, results)
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+                if manager is not None:
+                    self.header_claims = project.HeaderClaims(header_claims.get_claims())
+                    manager.shutdown()
+
+        self._link_objc_categories()
+
+    def _merge_task_results(self, tasks, results):
+        """
+        merge the (classes, methods, file stats, headers, libclang profile) results of the
+        workers in task order.
+        the models of a header follow the ones of the first file including it, taken
+        from the file which extracted the header with the same args
+        """
+        extracted = {}
+        if self.header_dirs is not None:
+            for result in results:
+                extracted.update(result[3][1])
+
+        for (file_path, clang_args), (classes, methods, file_stats, headers, profile) in izip(tasks, results):
+            self._merge(classes, methods)
+            if file_stats is not None and self.stats is not None:
+                self.stats.add(file_stats)
+            if profile:
+                cindex.add_libclang_profile(profile)
+            if headers is None:
+                continue
+            args = tuple(clang_args)
+            for header_path in headers[0]:
+                if header_path in self.placed_headers:
+                    continue
+                models = extracted.get((header_path, args))
+                if models is not None:
+                    self.placed_headers.add(header_path)
+                    self._merge(*models)
+
+    def iter_declarations(self, file_paths):
+        """
+        parse the files one after another and yield the ClassInfo and FunctionInfo
+        of each declaration as soon as it is created.
+        nothing is added to parsed_classes or methods, the caller owns the yielded
+        models. only the names of the classes seen are kept, to skip redeclarations.
+        the parents of the classes are linked through a registry per file, so the
+        models match the ones of parse_file and can be stored in the model cache.
+        in detach mode the models are detached before they are yielded.
+        """
+        # class name -> objc interface model, or None for the other classes
+        known_classes = {}
+        for file_path in file_paths:
+            if self.model_cache is not None:
+                cached = self.model_cache.load(file_path, self.clang_args, self.parse_options)
+                if cached is not None:
+                    classes, methods, include_paths = cached
+                    # the included files are the same, their digests match
+                    self._file_dependencies[file_path] = Parser._get_mtimes(include_paths)
+                    for class_name, nclass in classes:
+                        if not known_classes.has_key(class_name):
+                            known_classes[class_name] = Parser._known_class_value(nclass)
+                            yield nclass
+                    for method in methods:
+                        yield method
+                    continue
+
+            tu = self._load_translation_unit(file_path)
+            self._check_translation_unit(tu)
+            include_paths = [inclusion.include.name for inclusion in tu.get_includes()]
+            # files pulled in by a precompiled header are not reported by get_includes
+            include_paths.extend(get_forced_includes(self.clang_args))
+            self._file_dependencies[file_path] = Parser._get_mtimes(include_paths)
+            self._begin_translation_unit()
+            self._parsing_file = file_path.replace("\\", "/")
+
+            classes = []
+            methods = []
+            registry = ClassRegistry()
+            root = tu.cursor
+            if root.kind == cindex.CursorKind.TRANSLATION_UNIT:
+                for cursor in self._iter_declarations(tu, root):
+                    declaration = self._create_declaration(cursor, known_classes, registry)
+                    if declaration is None:
+                        continue
+                    if self.detach_models:
+                        declaration.detach()
+
+                    if isinstance(declaration, FunctionInfo):
+                        if self.model_cache is not None:
+                            methods.append(declaration)
+                    else:
+                        known_classes[cursor.displayname] = Parser._known_class_value(declaration)
+                        if self.model_cache is not None:
+                            classes.append((cursor.displayname, declaration))
+                    yield declaration
+
+            if self.detach_models:
+                # the bases created from their definitions
+                registry.detach()
+                self._end_translation_unit()
+            if self.model_cache is not None:
+                self.model_cache.store(file_path, self.clang_args, tu, classes, methods, self.parse_options)
+            # the generator keeps its locals until the next file is loaded
+            tu = root = cursor = None
+
+    @staticmethod
+    def _known_class_value(nclass):
+        # only objc categories look up the classes, don't keep the other classes alive
+        if isinstance(nclass, ObjcClassInfo):
+            return nclass
+        return None
+
+    def get_dependencies(self, file_path):
+        """
+        {path: mtime} of the files included by the file when iter_declarations last
+        extracted it, None if it didn't. the mtime of a missing file is None
+        """
+        return self._file_dependencies.get(file_path)
+
+    def get_stats(self):
+        """
+        the stats of every parsed file and their totals, or None if the stats opt is off
+        """
+        if self.stats is None:
+            return None
+        stats = self.stats.to_dict()
+        if cindex.Config.profiling:
+            # including the calls of the workers, see _merge_task_results
+            stats['libclang'] = [{'function': name, 'calls': calls, 'total': total, 'self': self_time}
+                                 for name, calls, total, self_time in cindex.get_libclang_profile()]
+        return stats
+
+    def write_chrome_trace(self, trace_path):
+        """
+        write the stats as a chrome trace, to open in chrome://tracing or perfetto
+        """
+        if self.stats is not None:
+            self.stats.write_chrome_trace(trace_path)
+
+    def _parse_file_result(self, file_path):
+        """
+        parse a single file and return the classes and methods it added
+        """
+        class_count = len(self.parsed_classes)
+        method_count = len(self.methods)
+        self.parse_file(file_path)
+        return self._added_since(class_count, method_count)
+
+    def _added_since(self, class_count, method_count):
+        """
+        return the classes and methods added after the containers had the given sizes
+        """
+        # parsed_classes only grows at the end, walk it backwards
+        class_names = list(islice(reversed(self.parsed_classes), len(self.parsed_classes) - class_count))
+        class_names.reverse()
+        classes = [(class_name, self.parsed_classes[class_name]) for class_name in class_names]
+        return classes, self.methods[method_count:]
+
+    def reparse_file(self, file_path, contents=None):
+        """
+        parse the file again in a long lived session.
+        the translation unit of the file is kept and reparsed, and declarations
+        are extracted again from the first one whose text, or the text before it,
+        changed. everything is extracted again when an included file changed.
+        contents is the unsaved content of the file, it is read from disk if None.
+        models extracted by the session are detached.
+        """
+        if contents is None:
+            with open(file_path, 'rb') as f:
+                contents = f.read()
+        unsaved_files = [(file_path, contents)]
+
+        tu = self.translation_units.get(file_path)
+        if tu is None:
+            options = self.parse_options | cindex.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE
+            tu = self.index.parse(file_path, self.clang_args, unsaved_files, options)
+            self.translation_units[file_path] = tu
+        else:
+            tu.reparse(unsaved_files)
+        self._check_translation_unit(tu)
+        self._begin_translation_unit()
+        self._parsing_file = file_path.replace("\\", "/")
+
+        # forget what the file declared, unchanged declarations are added back below
+        old_declarations = self._file_declarations.get(file_path, {})
+        old_methods = set()
+        for classes, methods in old_declarations.itervalues():
+            for class_name, nclass in classes:
+                if self.parsed_classes.get(class_name) is nclass:
+                    del self.parsed_classes[class_name]
+                    self.class_registry.remove(nclass)
+            old_methods.update(id(method) for method in methods)
+        self.methods[:] = [method for method in self.methods if id(method) not in old_methods]
+
+        # the types of the declarations depend on the included files
+        include_mtimes = Parser._get_include_mtimes(tu)
+        if include_mtimes != self._file_includes.get(file_path):
+            old_declarations = {}
+
+        declarations = OrderedDict()
+        # a declaration depends on the declarations and macros before it, so the
+        # signatures hash all the text up to the end of the declaration
+        prefix_hash = hashlib.sha1()
+        prefix_end = 0
+        for cursor in self._iter_declarations(tu, tu.cursor):
+            end_offset = cursor.extent.end.offset
+            if end_offset > prefix_end:
+                prefix_hash.update(contents[prefix_end:end_offset])
+                prefix_end = end_offset
+            signature = Parser._get_declaration_signature(cursor, prefix_hash.hexdigest())
+            declaration = old_declarations.get(signature)
+            if declaration is not None:
+                self._merge(*declaration)
+            else:
+                class_count = len(self.parsed_classes)
+                method_count = len(self.methods)
+                self._traverse_declaration(cursor)
+                declaration = self._added_since(class_count, method_count)
+                for class_name, nclass in declaration[0]:
+                    nclass.detach()
+                for method in declaration[1]:
+                    method.detach()
+            declarations[signature] = declaration
+        self.class_registry.detach()
+        self._file_declarations[file_path] = declarations
+        self._file_includes[file_path] = include_mtimes
+
+    @staticmethod
+    def _get_include_mtimes(tu):
+        return Parser._get_mtimes(inclusion.include.name for inclusion in tu.get_includes())
 
     @staticmethod
-    def _get_children_array_from_iter(cursor_iter):
-        children = []
-        for child in cursor_iter:
-            children.append(child)
-        return children
+    def _get_mtimes(file_names):
+        mtimes = {}
+        for file_name in file_names:
+            try:
+                mtimes[file_name] = os.path.getmtime(file_name)
+            except OSError:
+                mtimes[file_name] = None
+        return mtimes
+
+    def _iter_declarations(self, tu, root):
+        """
+        yield the declarations of the parsing file which _traverse extracts on its own,
+        looking into namespaces and objc implementations
+        """
+        # tu.get_file asserts on a file unknown to the unit, ask libclang for a null handle instead
+        main_file = cindex.conf.lib.clang_getFile(tu, self._parsing_file)
+        if main_file:
+            # compare file handles inside the visitor, declarations of included
+            # files are dropped before any per-cursor python work
+            walk = root.walk_preorder(descend=lambda c: c is root or c.kind in _container_kinds,
+                                      file=cindex.File(main_file))
+        else:
+            parsing_file = self._parsing_file
+            walk = root.walk_preorder(prune=lambda c: c is not root and not Parser.in_parse_file(c, parsing_file),
+                                      descend=lambda c: c is root or c.kind in _container_kinds)
+
+        for declaration in walk:
+            if declaration is not root and declaration.kind not in _container_kinds:
+                yield declaration
+
+    @staticmethod
+    def _get_declaration_signature(cursor, prefix_digest):
+        extent = cursor.extent
+        start = extent.start
+        end = extent.end
+        return (cursor.kind.value, cursor.displayname, start.line, start.column, end.line, end.column,
+                prefix_digest)
+
+    def _merge(self, classes, methods):
+        for class_name, nclass in classes:
+            if class_name not in self.parsed_classes:
+                self.parsed_classes[class_name] = self.class_registry.merge(nclass)
+        self.methods.extend(methods)
+
+    def _link_objc_categories(self):
+        for nclass in self.parsed_classes.itervalues():
+            if isinstance(nclass, ObjcClassInfo) and nclass.associated_class is None \
+                    and nclass.associated_class_displayname is not None:
+                nclass.associated_class = self.parsed_classes.get(nclass.associated_class_displayname)
 
     def _traverse(self, cursor):
         if not Parser.in_parse_file(cursor, self._parsing_file):
             return None
+        self._traverse_declaration(cursor)
+
+    def _traverse_declaration(self, cursor):
+        if cursor.kind == cindex.CursorKind.NAMESPACE:
+            # print("find namespace")
+            self.current_namespace = cursor.spelling
+            for sub_cursor in cursor.get_children():
+                self._traverse(sub_cursor)
+            self.current_namespace = None
+        elif cursor.kind == cindex.CursorKind.OBJC_IMPLEMENTATION_DECL \
+                or cursor.kind == cindex.CursorKind.OBJC_CATEGORY_IMPL_DECL:
+            # parse implementation directly
+            for sub_cursor in cursor.get_children():
+                self._traverse(sub_cursor)
+        else:
+            declaration = self._create_declaration(cursor, self.parsed_classes, self.class_registry)
+            if isinstance(declaration, FunctionInfo):
+                self.methods.append(declaration)
+            elif declaration is not None:
+                self.parsed_classes[cursor.displayname] = declaration
 
+    def _create_declaration(self, cursor, known_classes, registry=None):
+        """
+        create the model of a declaration, or return None if it is skipped.
+        known_classes maps the names of the classes already created to their models,
+        the parents of the classes are linked through the registry if given
+        """
+        declaration = None
         if cursor.kind == cindex.CursorKind.CLASS_DECL:
             # print("find class")
-            if cursor == cursor.type.get_declaration() and len(
-                    Parser._get_children_array_from_iter(cursor.get_children())) > 0:
+            if cursor == cursor.type.get_declaration() and cursor.has_children():
 
-                if not self.parsed_classes.has_key(cursor.displayname):
-                    nclass = ClassInfo(cursor)
-                    self.parsed_classes[cursor.displayname] = nclass
-                return
+                if not known_classes.has_key(cursor.displayname):
+                    # it may have been created already as the base of another class
+                    declaration = registry.get(cursor.get_usr()) if registry is not None else None
+                    if declaration is None:
+                        declaration = ClassInfo(cursor, registry)
         elif cursor.kind == cindex.CursorKind.FUNCTION_DECL:
             # print("find function")
-            fun = FunctionInfo(cursor)
-            self.methods.append(fun)
+            declaration = FunctionInfo(cursor)
         elif cursor.kind == cindex.CursorKind.CXX_METHOD:
             # print("find method")
-            method = FunctionInfo(cursor)
-            self.methods.append(method)
-        elif cursor.kind == cindex.CursorKind.NAMESPACE:
-            # print("find namespace")
-            self.current_namespace = cursor.spelling
-            for sub_cursor in cursor.get_children():
-                self._traverse(sub_cursor)
-            self.current_namespace = None
+            declaration = FunctionInfo(cursor)
         elif cursor.kind == cindex.CursorKind.CONSTRUCTOR:
             # print("find CONSTRUCTOR")
-            method = FunctionInfo(cursor)
-            self.methods.append(method)
+            declaration = FunctionInfo(cursor)
         elif cursor.kind == cindex.CursorKind.DESTRUCTOR:
             # print("find DESTRUCTOR")
-            method = FunctionInfo(cursor)
-            self.methods.append(method)
+            declaration = FunctionInfo(cursor)
         elif cursor.kind == cindex.CursorKind.OBJC_INTERFACE_DECL:
-            print("find OBJC_INTERFACE_DECL")
-            if not self.parsed_classes.has_key(cursor.displayname):
-                objc_class = ObjcClassInfo(cursor)
-                self.parsed_classes[cursor.displayname] = objc_class
+            if TRAVERSE.debug_enabled:
+                TRAVERSE.debug("find OBJC_INTERFACE_DECL %s", cursor.displayname)
+            if not known_classes.has_key(cursor.displayname):
+                declaration = registry.get(cursor.get_usr()) if registry is not None else None
+                if declaration is None:
+                    declaration = ObjcClassInfo(cursor, registry)
         elif cursor.kind == cindex.CursorKind.OBJC_CATEGORY_DECL:
-            print("find OBJC_CATEGORY_DECL")
-            if not self.parsed_classes.has_key(cursor.displayname):
-                objc_class = ObjcClassInfo(cursor)
-                objc_class.associated_class = self.parsed_classes[objc_class.associated_class_displayname]
-                self.parsed_classes[cursor.displayname] = objc_class
-        elif cursor.kind == cindex.CursorKind.OBJC_IMPLEMENTATION_DECL \
-                or cursor.kind == cindex.CursorKind.OBJC_CATEGORY_IMPL_DECL:
-            # parse implementation directly
-            for sub_cursor in cursor.get_children():
-                self._traverse(sub_cursor)
+            if TRAVERSE.debug_enabled:
+                TRAVERSE.debug("find OBJC_CATEGORY_DECL %s", cursor.displayname)
+            if not known_classes.has_key(cursor.displayname):
+                declaration = ObjcClassInfo(cursor, registry)
+                # the interface may live in a file which is not parsed yet, see _link_objc_categories
+                declaration.associated_class = known_classes.get(declaration.associated_class_displayname)
         elif cursor.kind == cindex.CursorKind.OBJC_INSTANCE_METHOD_DECL:
-            method = FunctionInfo(cursor)
-            self.methods.append(method)
-        else:
-            print("find %s" % cursor.kind)
+            declaration = FunctionInfo(cursor)
+        elif TRAVERSE.debug_enabled:
+            TRAVERSE.debug("skip %s %s", cursor.kind, cursor.displayname)
+
+        if declaration is not None:
+            declaration.file_path = self._parsing_file
+        return declaration
+
+    def inheritance_graph(self, unresolved=None):
+        """
+        map the name of every parsed class to the names of its parsed direct bases,
+        in the order of parsed_classes and of the base specifiers.
+        bases are matched by usr, or by full name when the usr is unknown, never by
+        the bare name which unrelated classes may share. if unresolved is a dict, it
+        gets the class names mapped to the full names of their bases which are not parsed
+        """
+        usr_names = {}
+        full_names = {}
+        for class_name, nclass in self.parsed_classes.iteritems():
+            if nclass.usr:
+                usr_names.setdefault(nclass.usr, class_name)
+            full_names.setdefault(nclass.full_class_name, class_name)
+
+        graph = OrderedDict()
+        for class_name, nclass in self.parsed_classes.iteritems():
+            parent_names = []
+            missing = []
+            bases = list(nclass.bases)
+            bases.extend((parent.class_name, parent.full_class_name, parent.usr) for parent in nclass.parents)
+            for base_name, base_full_name, base_usr in bases:
+                parent_name = usr_names.get(base_usr) if base_usr else None
+                if parent_name is None:
+                    parent_name = full_names.get(base_full_name)
+                if parent_name is None:
+                    if base_full_name not in missing:
+                        missing.append(base_full_name)
+                elif parent_name != class_name and parent_name not in parent_names:
+                    parent_names.append(parent_name)
+            graph[class_name] = parent_names
+            if missing and unresolved is not None:
+                unresolved[class_name] = missing
+        return graph
 
-    def sorted_classes(self):
+    def sorted_classes(self, graph=None):
         """
-        sorted classes in order of inheritance
+        sorted classes in order of inheritance.
+        bases come before the classes deriving from them, otherwise the order of
+        parsed_classes is kept. parents which are not keys of the graph are ignored
         """
+        if graph is None:
+            graph = self.inheritance_graph()
+
+        # kahn's algorithm, the ready class parsed first goes first
+        order = {}
+        for i, class_name in enumerate(graph):
+            order[class_name] = i
+        pending_bases = {}
+        children = {}
+        for class_name, parent_names in graph.iteritems():
+            pending_bases[class_name] = 0
+            for parent_name in parent_names:
+                if parent_name in order:
+                    pending_bases[class_name] += 1
+                    children.setdefault(parent_name, []).append(class_name)
+
+        ready = [order[class_name] for class_name, count in pending_bases.iteritems() if count == 0]
+        heapq.heapify(ready)
+        class_names = graph.keys()
         sorted_list = []
-        for class_name in self.parsed_classes.iterkeys():
-            nclass = self.parsed_classes[class_name]
-            sorted_list += self._sorted_parents(nclass)
-        # remove dupes from the list
-        no_dupes = []
-        [no_dupes.append(i) for i in sorted_list if not no_dupes.count(i)]
-        return no_dupes
-
-    def _sorted_parents(self, nclass):
-        """
-        returns the sorted list of parents for a native class
-        """
-        sorted_parents = []
-        for p in nclass.parents:
-            if p.class_name in self.parsed_classes.keys():
-                sorted_parents += self._sorted_parents(p)
-        if nclass.class_name in self.parsed_classes.keys():
-            sorted_parents.append(nclass.class_name)
-        return sorted_parents
+        while ready:
+            class_name = class_names[heapq.heappop(ready)]
+            sorted_list.append(class_name)
+            for child_name in children.get(class_name, ()):
+                pending_bases[child_name] -= 1
+                if pending_bases[child_name] == 0:
+                    heapq.heappush(ready, order[child_name])
+
+        if len(sorted_list) != len(class_names):
+            # the classes left are on a cycle or derive from one, only report the cycles
+            remaining = [class_name for class_name in class_names if pending_bases[class_name] > 0]
+            cycles = Parser._find_cycles(graph, remaining)
+            raise Exception("Inheritance cycle between classes: %s" %
+                            "; ".join(", ".join(sorted(cycle, key=order.get)) for cycle in cycles))
+        return sorted_list
+
+    @staticmethod
+    def _find_cycles(graph, class_names):
+        """
+        the strongly connected components of the graph restricted to class_names
+        which contain a cycle, found with tarjan's algorithm without recursion
+        """
+        nodes = set(class_names)
+
+        def edges(class_name):
+            return iter([parent_name for parent_name in graph[class_name] if parent_name in nodes])
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+        cycles = []
+        for root in class_names:
+            if root in index:
+                continue
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, edges(root))]
+            while work:
+                class_name, parent_names = work[-1]
+                for parent_name in parent_names:
+                    if parent_name not in index:
+                        index[parent_name] = lowlink[parent_name] = len(index)
+                        stack.append(parent_name)
+                        on_stack.add(parent_name)
+                        work.append((parent_name, edges(parent_name)))
+                        break
+                    elif parent_name in on_stack:
+                        lowlink[class_name] = min(lowlink[class_name], index[parent_name])
+                else:
+                    work.pop()
+                    if work:
+                        caller = work[-1][0]
+                        lowlink[caller] = min(lowlink[caller], lowlink[class_name])
+                    if lowlink[class_name] == index[class_name]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == class_name:
+                                break
+                        if len(component) > 1 or class_name in graph[class_name]:
+                            cycles.append(component)
+        return cycles
+
+
+# the parser owned by a worker process of Parser.parse_files
+_worker_parser = None
+
+
+def _init_worker(opts, clang_args, header_claims=None):
+    global _worker_parser
+    _worker_parser = Parser(dict(opts, clang_args=list(clang_args), win32_clang_flags=None, prefix_header=None))
+    # the clang args are already extended by the parent parser, including its precompiled header
+    _worker_parser.clang_args = list(clang_args)
+    # a forked worker starts with the counters of the parent, which keeps its own
+    cindex.reset_libclang_profile()
+    if header_claims is not None:
+        _worker_parser.header_claims = header_claims
+        # the parent merges the headers, see Parser._merge_task_results
+        _worker_parser.placed_headers = None
+
+
+def _parse_file_in_worker(task):
+    file_path, clang_args = task
+    parser = _worker_parser
+    parser.clang_args = clang_args
+    parser.parsed_classes = OrderedDict()
+    parser.methods = []
+    classes, methods = parser._parse_file_result(file_path)
+    # libclang handles can't be pickled back to the parent process
+    for class_name, nclass in classes:
+        nclass.detach()
+    for method in methods:
+        method.detach()
+    parser.class_registry.detach()
+    file_stats = parser.stats.files.pop() if parser.stats is not None else None
+
+    headers = parser._file_headers
+    if headers is not None:
+        # the header models go back apart from the ones of the file
+        parser._file_headers = None
+        header_models = set()
+        for header_classes, header_methods in headers[1].itervalues():
+            header_models.update(id(nclass) for class_name, nclass in header_classes)
+            header_models.update(id(method) for method in header_methods)
+        classes = [(class_name, nclass) for class_name, nclass in classes if id(nclass) not in header_models]
+        methods = [method for method in methods if id(method) not in header_models]
+
+    profile = None
+    if cindex.Config.profiling:
+        # the counters of the task, added to the ones of the parent
+        profile = cindex.get_libclang_profile()
+        cindex.reset_libclang_profile()
+    return classes, methods, file_stats, headers, profile
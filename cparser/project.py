@@ -0,0 +1,142 @@
+import os
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from clang import cindex
+
+# options whose value is a path, relative paths are resolved against the build directory
+_path_options = ('-I', '-isystem', '-iquote', '-idirafter', '-include', '-imacros', '-F', '-isysroot', '--sysroot')
+_joined_path_options = ('-I', '-isystem', '-iquote', '-idirafter', '-F', '--sysroot=')
+
+# launchers which run the compiler given after them
+_compiler_wrappers = frozenset(['ccache', 'sccache', 'distcc', 'icecc', 'buildcache'])
+
+# options which only matter to the build, not to the parse, and their argument count
+_dropped_options = {
+    '-c': 0,
+    '-o': 1,
+    '-MD': 0,
+    '-MMD': 0,
+    '-MP': 0,
+    '-MF': 1,
+    '-MT': 1,
+    '-MQ': 1
+}
+
+
+def _absolute(path, directory):
+    if os.path.isabs(path):
+        return os.path.normpath(path)
+    return os.path.normpath(os.path.join(directory, path))
+
+
+def _get_program_name(path):
+    name = os.path.basename(path.replace("\\", "/")).lower()
+    if name.endswith('.exe'):
+        name = name[:-4]
+    return name
+
+
+def get_command_args(arguments, file_path, directory):
+    """
+    the clang args of a compile command, without the compiler and its launchers
+    like ccache, the source file and the options which only matter to the build.
+    file_path is the absolute path of the source file, relative paths of the
+    path options are made absolute so the args don't depend on the current directory
+    """
+    args = []
+    arguments = list(arguments)
+    # the first argument is the compiler, or a launcher followed by the compiler
+    i = 0
+    while i < len(arguments) and _get_program_name(arguments[i]) in _compiler_wrappers:
+        i += 1
+    i += 1
+    while i < len(arguments):
+        arg = arguments[i]
+        i += 1
+        if arg in _dropped_options:
+            i += _dropped_options[arg]
+            continue
+        if arg.startswith(('-MF', '-MT', '-MQ')) or (arg.startswith('-o') and not arg.startswith('-objc')):
+            # the joined form -ofoo.o
+            continue
+        if not arg.startswith('-') and _absolute(arg, directory) == file_path:
+            continue
+
+        if arg in _path_options:
+            args.append(arg)
+            if i < len(arguments):
+                args.append(_absolute(arguments[i], directory))
+                i += 1
+            continue
+        for option in _joined_path_options:
+            if arg.startswith(option) and len(arg) > len(option):
+                # the joined form -Iinclude, or --sysroot=dir
+                arg = option + _absolute(arg[len(option):], directory)
+                break
+        args.append(arg)
+    return args
+
+
+def group_compile_commands(build_dir, file_filter=None):
+    """
+    read the compile_commands.json of build_dir and group its source files by
+    their clang args, see group_commands
+    """
+    database = cindex.CompilationDatabase.fromDirectory(build_dir)
+    commands = database.getAllCompileCommands()
+    if commands is None:
+        return OrderedDict()
+    return group_commands(commands, file_filter)
+
+
+def group_commands(commands, file_filter=None):
+    """
+    group the source files of the compile commands by their clang args, in the
+    order of the commands.
+    return an OrderedDict of args tuple -> list of absolute file paths.
+    a file listed by several commands is kept once, with the args of its first command.
+    file_filter, if given, is called with the absolute path of each file and
+    the files it returns False for are skipped
+    """
+    groups = OrderedDict()
+    seen = set()
+    for command in commands:
+        directory = command.directory
+        file_path = _absolute(command.filename, directory)
+        if file_path in seen:
+            continue
+        if file_filter is not None and not file_filter(file_path):
+            continue
+        seen.add(file_path)
+        args = tuple(get_command_args(command.arguments, file_path, directory))
+        groups.setdefault(args, []).append(file_path)
+    return groups
+
+
+class HeaderClaims(object):
+    """
+    the (header path, clang args) keys claimed by the parsed files, the declarations
+    of a header are extracted by the one file which claimed its key.
+    worker processes share one through a ClaimsManager, which costs one round trip per file
+    """
+
+    def __init__(self, claims=None):
+        # key -> path of the file which claimed it
+        self.claims = dict(claims or {})
+
+    def claim(self, keys, owner):
+        """
+        claim the keys not claimed yet for owner, return the ones owned by it
+        """
+        claims = self.claims
+        return [key for key in keys if claims.setdefault(key, owner) == owner]
+
+    def get_claims(self):
+        return dict(self.claims)
+
+
+class ClaimsManager(BaseManager):
+    pass
+
+
+ClaimsManager.register('HeaderClaims', HeaderClaims)
@@ -0,0 +1,405 @@
+import json
+from clang import cindex
+from infos import *
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_NAME = "cparser-model"
+# bump when the layout of the records changes
+FORMAT_VERSION = 3
+
+JSON_LINES = "jsonl"
+MSGPACK = "msgpack"
+
+
+def get_format(path):
+    if path.endswith(".msgpack") or path.endswith(".mpk"):
+        return MSGPACK
+    return JSON_LINES
+
+
+class ModelWriter(object):
+    """
+    write models to a stream of records, one record per type, class or function.
+
+    types are shared by many models, each one is written once as a "type" record
+    before the first model using it and referred to by index afterwards.
+    """
+
+    def __init__(self, stream, format=JSON_LINES):
+        self.stream = stream
+        self.format = format
+        if format == MSGPACK:
+            if msgpack is None:
+                raise Exception("msgpack is not installed")
+            self._packer = msgpack.Packer(use_bin_type=True)
+        elif format != JSON_LINES:
+            raise Exception("unknown model format %s" % format)
+
+        # id(TypeInfo) -> index, the types are kept so the ids stay unique
+        self._type_indexes = {}
+        self._types = []
+
+        self._write_record({"record": "header", "format": FORMAT_NAME, "version": FORMAT_VERSION})
+
+    def write(self, model):
+        if isinstance(model, ObjcClassInfo):
+            record = self._objc_class_record(model)
+        elif isinstance(model, ClassInfo):
+            record = self._class_record(model)
+        elif isinstance(model, FunctionInfo):
+            record = self._function_record(model)
+            record["record"] = "function"
+        else:
+            raise Exception("can't serialize %r" % model)
+        self._write_record(record)
+
+    def write_all(self, models):
+        for model in models:
+            self.write(model)
+
+    def _write_record(self, record):
+        if self.format == MSGPACK:
+            self.stream.write(self._packer.pack(record))
+        else:
+            self.stream.write(json.dumps(record, sort_keys=True, separators=(',', ':')))
+            self.stream.write("\n")
+
+    def _type_ref(self, nt):
+        if nt is None:
+            return None
+        index = self._type_indexes.get(id(nt))
+        if index is not None:
+            return index
+
+        record = {
+            "record": "type",
+            "is_object": nt.is_object,
+            "is_function": nt.is_function,
+            "is_enum": nt.is_enum,
+            "is_numeric": nt.is_numeric,
+            "is_const": nt.is_const,
+            "is_pointer": nt.is_pointer,
+            "not_supported": nt.not_supported,
+            "param_types": [self._type_ref(param_type) for param_type in nt.param_types],
+            "ret_type": self._type_ref(nt.ret_type),
+            "fullname": nt.fullname,
+            "namespace_name": nt.namespace_name,
+            "name": nt.name,
+            "whole_name": nt.whole_name,
+            "canonical_type": self._type_ref(nt.canonical_type)
+        }
+        index = len(self._types)
+        self._types.append(nt)
+        self._type_indexes[id(nt)] = index
+        record["id"] = index
+        self._write_record(record)
+        return index
+
+    @staticmethod
+    def _location_record(location):
+        location = LocationInfo.from_location(location)
+        if location is None:
+            return None
+        return [location.file_name, location.line, location.column]
+
+    def _field_record(self, field):
+        return {
+            "name": field.name,
+            "kind": field.kind.value,
+            "location": ModelWriter._location_record(field.location),
+            "signature_name": field.signature_name,
+            "field_type": self._type_ref(field.field_type),
+            "attributes": field.attributes
+        }
+
+    def _function_record(self, function):
+        return {
+            "func_name": function.func_name,
+            "signature_name": function.signature_name,
+            "arguments": [self._type_ref(nt) for nt in function.arguments],
+            "argumentTips": function.argumentTips,
+            "implementations": [self._function_record(impl) for impl in function.implementations],
+            "is_overloaded": function.is_overloaded,
+            "is_constructor": function.is_constructor,
+            "not_supported": function.not_supported,
+            "is_override": function.is_override,
+            "ret_type": self._type_ref(function.ret_type),
+            "comment": function.comment,
+            "attributes": function.attributes,
+            "class_name": function.class_name,
+            "min_args": function.min_args,
+            "namespace_name": function.namespace_name,
+            "file_path": function.file_path,
+            "usr": function.usr,
+            "extent": [function.get_extent_start_line(), function.get_extent_end_line()],
+            "location": ModelWriter._location_record(function.get_location())
+        }
+
+    def _class_record(self, nclass):
+        return {
+            "record": "class",
+            "class_name": nclass.class_name,
+            "is_ref_class": nclass.is_ref_class,
+            "full_class_name": nclass.full_class_name,
+            "parents": [parent.full_class_name for parent in nclass.parents],
+            "bases": [list(base) for base in nclass.bases],
+            "fields": [self._field_record(field) for field in nclass.fields],
+            "public_fields": [self._field_record(field) for field in nclass.public_fields],
+            "static_fields": [self._field_record(field) for field in nclass.static_fields],
+            "methods": [self._function_record(method) for method in nclass.methods],
+            "is_abstract": nclass.is_abstract,
+            "has_constructor": nclass.has_constructor,
+            "namespace_name": nclass.namespace_name,
+            "file_path": nclass.file_path,
+            "usr": nclass.usr,
+            "line": nclass.line,
+            "location": ModelWriter._location_record(nclass.get_location())
+        }
+
+    def _objc_class_record(self, nclass):
+        record = self._class_record(nclass)
+        record["record"] = "objc_class"
+        record["properties"] = [{
+            "name": p.name,
+            "kind": p.kind.value,
+            "location": ModelWriter._location_record(p.location),
+            "signature_name": p.signature_name,
+            "field_type": self._type_ref(p.field_type)
+        } for p in nclass.properties]
+        record["is_category"] = nclass.is_category
+        record["associated_class_displayname"] = nclass.associated_class_displayname
+        return record
+
+
+class ModelReader(object):
+    """
+    read the models written by ModelWriter back, one at a time.
+
+    the models are detached, they have no cursor.
+    parents and objc associated classes are linked by name to the classes read
+    from the same stream. a parent which comes later is a placeholder built from
+    the bases until then, and is replaced in the parents list once it is read.
+    """
+
+    def __init__(self, stream, format=JSON_LINES):
+        self.stream = stream
+        self.format = format
+        if format == MSGPACK:
+            if msgpack is None:
+                raise Exception("msgpack is not installed")
+        elif format != JSON_LINES:
+            raise Exception("unknown model format %s" % format)
+
+        self._types = []
+        # full class name -> class, class name -> objc class
+        self.classes = {}
+        self.objc_classes = {}
+        # full class name -> [(class, parent index)] waiting for the parent
+        self._pending_parents = {}
+        # full class name -> placeholder standing for the parent until then
+        self._placeholders = {}
+        # class name -> [objc class] waiting for the associated class
+        self._pending_associations = {}
+
+    def __iter__(self):
+        records = self._iter_records()
+        header = next(records, None)
+        if header is None or header.get("record") != "header" or header.get("format") != FORMAT_NAME:
+            raise Exception("not a model stream")
+        if header["version"] != FORMAT_VERSION:
+            raise Exception("unsupported model format version %s" % header["version"])
+
+        for record in records:
+            kind = record["record"]
+            if kind == "type":
+                self._read_type(record)
+            elif kind == "class":
+                yield self._read_class(ClassInfo.__new__(ClassInfo), record)
+            elif kind == "objc_class":
+                yield self._read_objc_class(record)
+            elif kind == "function":
+                yield self._read_function(record)
+
+    def _iter_records(self):
+        if self.format == MSGPACK:
+            for record in msgpack.Unpacker(self.stream, raw=False):
+                yield record
+        else:
+            for line in self.stream:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+    @staticmethod
+    def _read_location(record):
+        if record is None:
+            return None
+        return LocationInfo(*record)
+
+    def _get_placeholder(self, parent_name, bases):
+        placeholder = self._placeholders.get(parent_name)
+        if placeholder is None:
+            base = (parent_name.split("::")[-1], parent_name, None)
+            for name, full_name, usr in bases:
+                if full_name == parent_name:
+                    base = (name, full_name, usr)
+                    break
+            placeholder = ClassInfo.placeholder(*base)
+            self._placeholders[parent_name] = placeholder
+        return placeholder
+
+    def _get_type(self, index):
+        if index is None:
+            return None
+        return self._types[index]
+
+    def _read_type(self, record):
+        nt = TypeInfo()
+        nt.is_object = record["is_object"]
+        nt.is_function = record["is_function"]
+        nt.is_enum = record["is_enum"]
+        nt.is_numeric = record["is_numeric"]
+        nt.is_const = record["is_const"]
+        nt.is_pointer = record["is_pointer"]
+        nt.not_supported = record["not_supported"]
+        nt.param_types = [self._get_type(index) for index in record["param_types"]]
+        nt.ret_type = self._get_type(record["ret_type"])
+        nt.fullname = record["fullname"]
+        nt.namespace_name = record["namespace_name"]
+        nt.name = record["name"]
+        nt.whole_name = record["whole_name"]
+        nt.canonical_type = self._get_type(record["canonical_type"])
+        self._types.append(nt)
+
+    def _read_field(self, record):
+        field = FieldInfo.__new__(FieldInfo)
+        field.cursor = None
+        field.name = record["name"]
+        field.kind = cindex.TypeKind.from_id(record["kind"])
+        field.location = ModelReader._read_location(record["location"])
+        field.signature_name = record["signature_name"]
+        field.field_type = self._get_type(record["field_type"])
+        field.attributes = record["attributes"]
+        return field
+
+    def _read_function(self, record):
+        function = FunctionInfo.__new__(FunctionInfo)
+        function.cursor = None
+        function.func_name = record["func_name"]
+        function.signature_name = record["signature_name"]
+        function.arguments = [self._get_type(index) for index in record["arguments"]]
+        function.argumentTips = record["argumentTips"]
+        function.implementations = [self._read_function(impl) for impl in record["implementations"]]
+        function.is_overloaded = record["is_overloaded"]
+        function.is_constructor = record["is_constructor"]
+        function.not_supported = record["not_supported"]
+        function.is_override = record["is_override"]
+        function.ret_type = self._get_type(record["ret_type"])
+        function.comment = record["comment"]
+        function.attributes = record["attributes"]
+        function.class_name = record["class_name"]
+        function.min_args = record["min_args"]
+        function.namespace_name = record["namespace_name"]
+        function.file_path = record["file_path"]
+        function.usr = record["usr"]
+        function._extent_start_line, function._extent_end_line = record["extent"]
+        function._location = ModelReader._read_location(record["location"])
+        return function
+
+    def _read_class(self, nclass, record):
+        nclass.cursor = None
+        nclass.class_name = record["class_name"]
+        nclass.is_ref_class = record["is_ref_class"]
+        nclass.full_class_name = record["full_class_name"]
+        nclass.fields = [self._read_field(field) for field in record["fields"]]
+        nclass.public_fields = [self._read_field(field) for field in record["public_fields"]]
+        nclass.static_fields = [self._read_field(field) for field in record["static_fields"]]
+        nclass.methods = [self._read_function(method) for method in record["methods"]]
+        nclass.is_abstract = record["is_abstract"]
+        nclass._current_visibility = cindex.AccessSpecifier.PRIVATE
+        nclass.override_methods = {}
+        nclass.has_constructor = record["has_constructor"]
+        nclass.namespace_name = record["namespace_name"]
+        nclass.file_path = record["file_path"]
+        nclass.usr = record["usr"]
+        nclass.line = record["line"]
+        nclass.bases = [tuple(base) for base in record["bases"]]
+        nclass.is_placeholder = False
+        nclass._location = ModelReader._read_location(record["location"])
+        nclass._registry = None
+
+        nclass.parents = []
+        for parent_name in record["parents"]:
+            parent = self.classes.get(parent_name)
+            if parent is None:
+                parent = self._get_placeholder(parent_name, nclass.bases)
+                self._pending_parents.setdefault(parent_name, []).append((nclass, len(nclass.parents)))
+            nclass.parents.append(parent)
+
+        self.classes[nclass.full_class_name] = nclass
+        self._placeholders.pop(nclass.full_class_name, None)
+        for child, index in self._pending_parents.pop(nclass.full_class_name, []):
+            child.parents[index] = nclass
+        return nclass
+
+    def _read_objc_class(self, record):
+        nclass = ObjcClassInfo.__new__(ObjcClassInfo)
+        properties = []
+        for p_record in record["properties"]:
+            p = ObjcProperty.__new__(ObjcProperty)
+            p.cursor = None
+            p.name = p_record["name"]
+            p.kind = cindex.TypeKind.from_id(p_record["kind"])
+            p.location = ModelReader._read_location(p_record["location"])
+            p.signature_name = p_record["signature_name"]
+            p.field_type = self._get_type(p_record["field_type"])
+            properties.append(p)
+        nclass.properties = properties
+        nclass.is_category = record["is_category"]
+        nclass.associated_class_displayname = record["associated_class_displayname"]
+        self._read_class(nclass, record)
+
+        nclass.associated_class = None
+        if nclass.associated_class_displayname is not None:
+            nclass.associated_class = self.objc_classes.get(nclass.associated_class_displayname)
+            if nclass.associated_class is None:
+                self._pending_associations.setdefault(nclass.associated_class_displayname, []).append(nclass)
+
+        self.objc_classes[nclass.class_name] = nclass
+        for category in self._pending_associations.pop(nclass.class_name, []):
+            category.associated_class = nclass
+        return nclass
+
+
+def dump_models(models, path, format=None):
+    """
+    write the models to path, the format is guessed from the extension if not given
+    """
+    if format is None:
+        format = get_format(path)
+    with open(path, 'wb') as f:
+        ModelWriter(f, format).write_all(models)
+
+
+def load_models(path, format=None):
+    """
+    yield the models stored in path
+    """
+    if format is None:
+        format = get_format(path)
+    with open(path, 'rb') as f:
+        for model in ModelReader(f, format):
+            yield model
+
+
+def get_parser_models(parser):
+    """
+    the classes and the free functions and methods collected by a parser, in order
+    """
+    models = list(parser.parsed_classes.itervalues())
+    models.extend(parser.methods)
+    return models
@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+from collections import defaultdict
+from clang import cindex
+from infos import TypeInfo
+import infos
+
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
+
+
+def get_peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on mac, kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak //= 1024
+    return peak
+
+
+class FileStats(object):
+    """
+    timings and counters of parsing one file.
+
+    phases are timed back to back, end_phase closes the phase started by the
+    previous end_phase, or by the creation of the stats.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.pid = os.getpid()
+        self.start = time.time()
+        self.end = None
+        self.cached = False
+        # phase name -> seconds, and (name, start, end) for the trace
+        self.phases = {}
+        self.events = []
+        # cursor kind -> count of the declarations and class members traversed
+        self.cursor_kinds = defaultdict(int)
+        self.callbacks = 0
+        self.type_cache_hits = 0
+        self.type_cache_misses = 0
+        self.classes = 0
+        self.methods = 0
+        self.fields = 0
+        self.peak_rss_kb = None
+
+        self._phase_start = self.start
+        self._callbacks_start = cindex.cursor_visit_calls[0]
+        self._hits_start = TypeInfo.type_cache.hits
+        self._misses_start = TypeInfo.type_cache.misses
+        infos.cursor_kind_counts = self.cursor_kinds
+
+    def end_phase(self, name):
+        now = time.time()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self._phase_start
+        self.events.append((name, self._phase_start, now))
+        self._phase_start = now
+
+    def finish(self, classes, methods):
+        """
+        close the stats with the classes and methods extracted from the file
+        """
+        self.end = time.time()
+        self.callbacks = cindex.cursor_visit_calls[0] - self._callbacks_start
+        self.type_cache_hits = TypeInfo.type_cache.hits - self._hits_start
+        self.type_cache_misses = TypeInfo.type_cache.misses - self._misses_start
+        self.classes = len(classes)
+        self.methods = len(methods)
+        for class_name, nclass in classes:
+            self.methods += len(nclass.methods)
+            self.fields += len(nclass.fields) + len(nclass.static_fields)
+        self.peak_rss_kb = get_peak_rss_kb()
+        if infos.cursor_kind_counts is self.cursor_kinds:
+            infos.cursor_kind_counts = None
+        # cursor kinds don't pickle back from the workers, keep their names
+        self.cursor_kinds = dict((kind.name, count) for kind, count in self.cursor_kinds.iteritems())
+
+    @property
+    def wall_time(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            'file': self.file_path,
+            'pid': self.pid,
+            'cached': self.cached,
+            'wall_time': self.wall_time,
+            'phases': dict(self.phases),
+            'cursor_kinds': dict(self.cursor_kinds),
+            'callbacks': self.callbacks,
+            'type_cache_hits': self.type_cache_hits,
+            'type_cache_misses': self.type_cache_misses,
+            'models': {
+                'classes': self.classes,
+                'methods': self.methods,
+                'fields': self.fields,
+                'types': self.type_cache_misses
+            },
+            'peak_rss_kb': self.peak_rss_kb
+        }
+
+
+class ParserStats(object):
+    """
+    the FileStats of every file parsed by a parser, and their totals
+    """
+
+    def __init__(self):
+        self.files = []
+
+    def begin_file(self, file_path):
+        file_stats = FileStats(file_path)
+        self.files.append(file_stats)
+        return file_stats
+
+    def add(self, file_stats):
+        self.files.append(file_stats)
+
+    def aggregate(self):
+        phases = defaultdict(float)
+        cursor_kinds = defaultdict(int)
+        totals = {
+            'files': len(self.files),
+            'cached_files': 0,
+            'wall_time': 0.0,
+            'callbacks': 0,
+            'type_cache_hits': 0,
+            'type_cache_misses': 0,
+            'models': defaultdict(int),
+            'peak_rss_kb': None
+        }
+        for file_stats in self.files:
+            if file_stats.cached:
+                totals['cached_files'] += 1
+            totals['wall_time'] += file_stats.wall_time
+            totals['callbacks'] += file_stats.callbacks
+            totals['type_cache_hits'] += file_stats.type_cache_hits
+            totals['type_cache_misses'] += file_stats.type_cache_misses
+            for name, seconds in file_stats.phases.iteritems():
+                phases[name] += seconds
+            for kind, count in file_stats.cursor_kinds.iteritems():
+                cursor_kinds[kind] += count
+            for name, count in file_stats.to_dict()['models'].iteritems():
+                totals['models'][name] += count
+            peak_rss_kb = file_stats.peak_rss_kb
+            if peak_rss_kb is not None and (totals['peak_rss_kb'] is None or peak_rss_kb > totals['peak_rss_kb']):
+                totals['peak_rss_kb'] = peak_rss_kb
+        totals['phases'] = dict(phases)
+        totals['cursor_kinds'] = dict(cursor_kinds)
+        totals['models'] = dict(totals['models'])
+        return totals
+
+    def to_dict(self):
+        return {
+            'files': [file_stats.to_dict() for file_stats in self.files],
+            'total': self.aggregate()
+        }
+
+    def to_chrome_trace(self):
+        """
+        the stats as chrome trace events, one complete event per file and per phase
+        """
+        events = []
+        for file_stats in self.files:
+            events.append({
+                'name': os.path.basename(file_stats.file_path),
+                'cat': 'file',
+                'ph': 'X',
+                'ts': file_stats.start * 1e6,
+                'dur': file_stats.wall_time * 1e6,
+                'pid': file_stats.pid,
+                'tid': 0,
+                'args': file_stats.to_dict()
+            })
+            for name, start, end in file_stats.events:
+                events.append({
+                    'name': name,
+                    'cat': 'phase',
+                    'ph': 'X',
+                    'ts': start * 1e6,
+                    'dur': (end - start) * 1e6,
+                    'pid': file_stats.pid,
+                    'tid': 0
+                })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
@@ -0,0 +1,317 @@
+import os
+import hashlib
+import sqlite3
+from infos import *
+
+# bump when the schema changes, older databases are rebuilt
+SCHEMA_VERSION = 2
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    args_digest TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dependencies (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    mtime REAL
+);
+
+CREATE TABLE IF NOT EXISTS types (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    fullname TEXT NOT NULL,
+    whole_name TEXT NOT NULL,
+    UNIQUE (name, fullname, whole_name)
+);
+
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    namespace TEXT NOT NULL,
+    usr TEXT,
+    is_objc INTEGER NOT NULL,
+    line INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS bases (
+    class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    full_name TEXT NOT NULL,
+    usr TEXT
+);
+
+CREATE TABLE IF NOT EXISTS methods (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    class_id INTEGER REFERENCES classes(id) ON DELETE CASCADE,
+    class_name TEXT,
+    name TEXT NOT NULL,
+    namespace TEXT NOT NULL,
+    usr TEXT,
+    ret_type_id INTEGER REFERENCES types(id),
+    attributes INTEGER NOT NULL,
+    min_args INTEGER NOT NULL,
+    start_line INTEGER,
+    end_line INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS params (
+    method_id INTEGER NOT NULL REFERENCES methods(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    type_id INTEGER NOT NULL REFERENCES types(id)
+);
+
+CREATE TABLE IF NOT EXISTS fields (
+    class_id INTEGER NOT NULL REFERENCES classes(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    type_id INTEGER NOT NULL REFERENCES types(id),
+    attributes INTEGER NOT NULL,
+    is_static INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS dependencies_file ON dependencies(file_id);
+CREATE INDEX IF NOT EXISTS classes_name ON classes(name);
+CREATE INDEX IF NOT EXISTS classes_full_name ON classes(full_name);
+CREATE INDEX IF NOT EXISTS classes_usr ON classes(usr);
+CREATE INDEX IF NOT EXISTS classes_file ON classes(file_id);
+CREATE INDEX IF NOT EXISTS bases_class ON bases(class_id);
+CREATE INDEX IF NOT EXISTS bases_name ON bases(name);
+CREATE INDEX IF NOT EXISTS bases_full_name ON bases(full_name);
+CREATE INDEX IF NOT EXISTS bases_usr ON bases(usr);
+CREATE INDEX IF NOT EXISTS methods_name ON methods(name);
+CREATE INDEX IF NOT EXISTS methods_class ON methods(class_id);
+CREATE INDEX IF NOT EXISTS methods_file ON methods(file_id);
+CREATE INDEX IF NOT EXISTS methods_usr ON methods(usr);
+CREATE INDEX IF NOT EXISTS params_method ON params(method_id);
+CREATE INDEX IF NOT EXISTS params_type ON params(type_id);
+CREATE INDEX IF NOT EXISTS fields_class ON fields(class_id);
+CREATE INDEX IF NOT EXISTS types_name ON types(name);
+CREATE INDEX IF NOT EXISTS types_fullname ON types(fullname);
+"""
+
+_derived_classes_query = """
+WITH RECURSIVE derived(id, full_name, usr) AS (
+    SELECT c.id, c.full_name, c.usr FROM classes c JOIN bases b ON b.class_id = c.id
+    WHERE b.full_name = ? OR b.name = ?
+    UNION
+    SELECT c.id, c.full_name, c.usr FROM classes c JOIN bases b ON b.class_id = c.id
+    JOIN derived d ON b.usr = d.usr OR b.full_name = d.full_name
+)
+SELECT DISTINCT full_name FROM derived ORDER BY full_name
+"""
+
+_method_columns = """
+SELECT m.class_name, m.name, m.namespace, m.usr, f.path, m.start_line, m.end_line
+FROM methods m JOIN files f ON f.id = m.file_id
+"""
+
+
+class SymbolIndex(object):
+    """
+    sqlite database of the classes, methods, fields, types and inheritance
+    edges found by the parser.
+
+    the index is updated per file: a file is parsed again only when it or one
+    of the files it includes was modified, or the clang args changed since it
+    was indexed, and its rows are replaced in one transaction.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+
+        version = self.db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._drop_tables()
+            self.db.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+        self.db.executescript(_schema)
+        self.db.commit()
+
+        # (name, fullname, whole_name) -> type id
+        self._type_ids = {}
+
+    def close(self):
+        self.db.close()
+
+    def _drop_tables(self):
+        for table in ('params', 'fields', 'bases', 'methods', 'classes', 'types', 'dependencies', 'files'):
+            self.db.execute("DROP TABLE IF EXISTS %s" % table)
+
+    @staticmethod
+    def _get_args_digest(clang_args):
+        h = hashlib.sha1()
+        for clang_arg in clang_args:
+            h.update(clang_arg)
+            h.update("\0")
+        return h.hexdigest()
+
+    @staticmethod
+    def _normalize_path(file_path):
+        return file_path.replace("\\", "/")
+
+    @staticmethod
+    def _get_mtime(file_path):
+        try:
+            return os.path.getmtime(file_path)
+        except OSError:
+            return None
+
+    def is_up_to_date(self, file_path, clang_args):
+        st = os.stat(file_path)
+        row = self.db.execute("SELECT id, mtime, size, args_digest FROM files WHERE path = ?",
+                              (SymbolIndex._normalize_path(file_path),)).fetchone()
+        if row is None or row[1] != st.st_mtime or row[2] != st.st_size \
+                or row[3] != SymbolIndex._get_args_digest(clang_args):
+            return False
+
+        # the declarations of the file depend on the headers it includes, like the .deps of AstCache
+        for dep_path, mtime in self.db.execute("SELECT path, mtime FROM dependencies WHERE file_id = ?", (row[0],)):
+            if SymbolIndex._get_mtime(dep_path) != mtime:
+                return False
+        return True
+
+    def update_file(self, parser, file_path, force=False):
+        """
+        index the file with the parser if it changed, return True if it was parsed
+        """
+        if not force and self.is_up_to_date(file_path, parser.clang_args):
+            return False
+
+        st = os.stat(file_path)
+        try:
+            with self.db:
+                self._remove_file(file_path)
+                file_id = self.db.execute("INSERT INTO files (path, mtime, size, args_digest) VALUES (?, ?, ?, ?)",
+                                          (SymbolIndex._normalize_path(file_path), st.st_mtime, st.st_size,
+                                           SymbolIndex._get_args_digest(parser.clang_args))).lastrowid
+                for declaration in parser.iter_declarations([file_path]):
+                    if isinstance(declaration, FunctionInfo):
+                        self._insert_method(file_id, None, declaration)
+                    else:
+                        self._insert_class(file_id, declaration)
+                # the included files are known once the file is parsed
+                dependencies = parser.get_dependencies(file_path) or {}
+                self.db.executemany("INSERT INTO dependencies (file_id, path, mtime) VALUES (?, ?, ?)",
+                                    [(file_id, os.path.abspath(dep_path), mtime)
+                                     for dep_path, mtime in dependencies.iteritems()])
+        except:
+            # the type rows inserted by the update are rolled back, their ids may be given to other types
+            self._type_ids.clear()
+            raise
+        return True
+
+    def update_files(self, parser, file_paths):
+        """
+        index the files which changed, return the paths which were parsed
+        """
+        return [file_path for file_path in file_paths if self.update_file(parser, file_path)]
+
+    def remove_file(self, file_path):
+        with self.db:
+            self._remove_file(file_path)
+
+    def _remove_file(self, file_path):
+        # the rows of the file go with it, see ON DELETE CASCADE
+        self.db.execute("DELETE FROM files WHERE path = ?", (SymbolIndex._normalize_path(file_path),))
+
+    def _get_type_id(self, nt):
+        key = (nt.name, nt.fullname, nt.whole_name or "")
+        type_id = self._type_ids.get(key)
+        if type_id is None:
+            row = self.db.execute("SELECT id FROM types WHERE name = ? AND fullname = ? AND whole_name = ?",
+                                  key).fetchone()
+            if row is not None:
+                type_id = row[0]
+            else:
+                type_id = self.db.execute("INSERT INTO types (name, fullname, whole_name) VALUES (?, ?, ?)",
+                                          key).lastrowid
+            self._type_ids[key] = type_id
+        return type_id
+
+    def _insert_class(self, file_id, nclass):
+        class_id = self.db.execute(
+            "INSERT INTO classes (file_id, name, full_name, namespace, usr, is_objc, line) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file_id, nclass.class_name, nclass.full_class_name, nclass.namespace_name, nclass.usr,
+             isinstance(nclass, ObjcClassInfo), nclass.line)).lastrowid
+
+        self.db.executemany("INSERT INTO bases (class_id, position, name, full_name, usr) VALUES (?, ?, ?, ?, ?)",
+                            [(class_id, i, name, full_name, usr)
+                             for i, (name, full_name, usr) in enumerate(nclass.bases)])
+
+        fields = [(field, False) for field in nclass.fields]
+        fields.extend((field, True) for field in nclass.static_fields)
+        self.db.executemany("INSERT INTO fields (class_id, name, type_id, attributes, is_static) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            [(class_id, field.name, self._get_type_id(field.field_type), field.attributes, is_static)
+                             for field, is_static in fields])
+
+        for method in nclass.methods:
+            self._insert_method(file_id, class_id, method)
+
+    def _insert_method(self, file_id, class_id, method):
+        method_id = self.db.execute(
+            "INSERT INTO methods (file_id, class_id, class_name, name, namespace, usr, ret_type_id, attributes, "
+            "min_args, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_id, class_id, method.class_name, method.func_name, method.namespace_name, method.usr,
+             self._get_type_id(method.ret_type), method.attributes, method.min_args,
+             method.get_extent_start_line(), method.get_extent_end_line())).lastrowid
+
+        self.db.executemany("INSERT INTO params (method_id, position, name, type_id) VALUES (?, ?, ?, ?)",
+                            [(method_id, i, name, self._get_type_id(nt))
+                             for i, (name, nt) in enumerate(zip(method.argumentTips, method.arguments))])
+
+    def find_classes(self, name):
+        """
+        (full name, file, line) of the classes with the given name or full name
+        """
+        return self.db.execute("SELECT c.full_name, f.path, c.line FROM classes c JOIN files f ON f.id = c.file_id "
+                               "WHERE c.name = ? OR c.full_name = ?", (name, name)).fetchall()
+
+    def derived_classes(self, class_name):
+        """
+        full names of the classes deriving from class_name, directly or not
+        """
+        return [row[0] for row in self.db.execute(_derived_classes_query, (class_name, class_name))]
+
+    def base_classes(self, class_name):
+        """
+        (name, full name, usr) of the direct bases of the class
+        """
+        return self.db.execute("SELECT b.name, b.full_name, b.usr FROM bases b JOIN classes c ON c.id = b.class_id "
+                               "WHERE c.name = ? OR c.full_name = ? ORDER BY b.position",
+                               (class_name, class_name)).fetchall()
+
+    def find_methods(self, name, class_name=None):
+        """
+        (class name, name, namespace, usr, file, start line, end line) of the methods
+        and functions with the given name, one row per overload
+        """
+        if class_name is None:
+            return self.db.execute(_method_columns + "WHERE m.name = ?", (name,)).fetchall()
+        return self.db.execute(_method_columns + "WHERE m.name = ? AND m.class_name = ?",
+                               (name, class_name)).fetchall()
+
+    def methods_taking(self, type_name):
+        """
+        the methods with a parameter of the given type, matched by name or full name
+        """
+        return self.db.execute(_method_columns + "WHERE m.id IN (SELECT p.method_id FROM params p "
+                                                 "JOIN types t ON t.id = p.type_id "
+                                                 "WHERE t.name = ? OR t.fullname = ?)",
+                               (type_name, type_name)).fetchall()
+
+    def methods_returning(self, type_name):
+        return self.db.execute(_method_columns + "JOIN types t ON t.id = m.ret_type_id "
+                                                 "WHERE t.name = ? OR t.fullname = ?",
+                               (type_name, type_name)).fetchall()
@@ -1,3 +1,6 @@
+import re
+from bisect import bisect_left
+from itertools import islice
 from clang import cindex
 
 type_map = {
@@ -106,52 +109,89 @@ access_specifier_map = {
 }
 
 
-def find_sub_string_count(s, start, end, substr):
-    count = 0
-    pos = s.find(substr, start, end)
-    if pos != -1:
-        next_count = find_sub_string_count(s, pos + 1, end, substr)
-        count = next_count + 1
-    return count
+_container_token_re = re.compile('[<>,]')
 
 
-def split_container_name(name):
-    name = name.strip()
-    left = name.find('<')
-    right = -1
-
-    if left != -1:
-        right = name.rfind('>')
-
-    if left == -1 or right == -1:
-        return [name]
+def _scan_type_name(name):
+    """
+    find the brackets and commas of a type name in one pass over the name.
+    the sections of any part of the name are looked up from them, so the nested
+    template arguments are never scanned again, see _get_sections.
+    return (name, positions of '<', depth inside each '<', positions of '>',
+    positions of ',', depth -> positions of the commas at that depth)
+    """
+    opens = []
+    open_depths = []
+    closes = []
+    commas = []
+    depth_commas = {}
+    depth = 0
+    for m in _container_token_re.finditer(name):
+        pos = m.start()
+        token = name[pos]
+        if token == '<':
+            depth += 1
+            opens.append(pos)
+            open_depths.append(depth)
+        elif token == '>':
+            depth -= 1
+            closes.append(pos)
+        else:
+            commas.append(pos)
+            depth_commas.setdefault(depth, []).append(pos)
+    return name, opens, open_depths, closes, commas, depth_commas
 
-    first = name[:left]
-    results = [first]
 
-    comma = name.find(',', left + 1, right)
-    if comma == -1:
-        results.append(name[left + 1:right].strip())
+def _get_sections(scan, start, end):
+    """
+    the ranges of the sections of name[start:end], see split_container_name.
+    the container name is split at the first '<' and the arguments end at the
+    last '>', their top level commas have the depth inside that '<'.
+    the range of the container name is stripped, the other ones are not
+    """
+    name, opens, open_depths, closes, commas, depth_commas = scan
+    while start < end and name[start].isspace():
+        start += 1
+    while end > start and name[end - 1].isspace():
+        end -= 1
+
+    index = bisect_left(opens, start)
+    if index == len(opens) or opens[index] >= end:
+        return [(start, end)]
+    left = opens[index]
+    right_index = bisect_left(closes, end) - 1
+    if right_index < 0 or closes[right_index] < start:
+        return [(start, end)]
+    right = closes[right_index]
+
+    results = [(start, left)]
+    comma_index = bisect_left(commas, left + 1)
+    if comma_index == len(commas) or commas[comma_index] >= right:
+        results.append((left + 1, max(left + 1, right)))
         return results
 
-    left += 1
-    while comma != -1:
-        lt_count = find_sub_string_count(name, left, comma, '<')
-        gt_count = find_sub_string_count(name, left, comma, '>')
-        if lt_count == gt_count:
-            results.append(name[left:comma].strip())
-            left = comma + 1
-        comma = name.find(',', comma + 1, right)
-
-    if left < right:
-        results.append(name[left:right].strip())
-    name_len = len(name)
-    if right < name_len - 1:
-        results.append(name[right + 1:].strip())
-
+    # split the arguments at the commas which are not nested in another template
+    argument_start = left + 1
+    top_commas = depth_commas[open_depths[index]] if open_depths[index] in depth_commas else ()
+    for comma in islice(top_commas, bisect_left(top_commas, left + 1), None):
+        if comma >= right:
+            break
+        results.append((argument_start, comma))
+        argument_start = comma + 1
+
+    if argument_start < right:
+        results.append((argument_start, right))
+    if right < end - 1:
+        results.append((right + 1, end))
     return results
 
 
+def split_container_name(name):
+    sections = _get_sections(_scan_type_name(name), 0, len(name))
+    start, end = sections[0]
+    return [name[start:end]] + [name[start:end].strip() for start, end in sections[1:]]
+
+
 def normalize_type_name_by_sections(sections):
     container_name = sections[0]
     suffix = ''
@@ -181,49 +221,119 @@ def normalize_std_function_by_sections(sections):
     return normalized_name
 
 
-def normalize_type_str(s, depth=1):
-    if s.find('std::function') == 0 or s.find('function') == 0:
-        start = s.find('<')
-        assert (start > 0)
-        sections = [s[:start]]  # std::function
-        start += 1
-        ret_pos = s.find('(', start)
-        sections.append(s[start:ret_pos].strip())  # return type
-        end = s.find(')', ret_pos + 1)
-        sections.append('std_function_args<' + s[ret_pos + 1:end].strip() + '>')
-    else:
-        sections = split_container_name(s)
-    section_len = len(sections)
-    if section_len == 1:
-        return sections[0]
-
-    # for section in sections:
-    #     print('>' * depth + section)
-
-    if sections[0] == 'const std::basic_string' or sections[0] == 'const basic_string':
-        last_section = sections[len(sections) - 1]
-        if last_section == '&' or last_section == '*' or last_section.startswith('::'):
-            return 'const std::string' + last_section
-        else:
-            return 'const std::string'
+# type string -> normalized name, the same strings come up over and over.
+# cleared with the name cache
+_normalized_type_names = {}
 
-    elif sections[0] == 'std::basic_string' or sections[0] == 'basic_string':
-        last_section = sections[len(sections) - 1]
-        if last_section == '&' or last_section == '*' or last_section.startswith('::'):
-            return 'std::string' + last_section
-        else:
-            return 'std::string'
+# the names normalized as std::function, split at their signature instead of their commas
+_function_prefixes = ('std::function', 'function')
 
-    for i in range(1, section_len):
-        sections[i] = normalize_type_str(sections[i], depth + 1)
+# basic_string containers -> their normalized name
+_string_names = {
+    'const std::basic_string': 'const std::string',
+    'const basic_string': 'const std::string',
+    'std::basic_string': 'std::string',
+    'basic_string': 'std::string'
+}
 
-    if sections[0] == 'std::function' or sections[0] == 'function' or sections[0] == 'std_function_args':
-        normalized_name = normalize_std_function_by_sections(sections)
-    else:
-        normalized_name = normalize_type_name_by_sections(sections)
+
+def normalize_type_str(s):
+    normalized_name = _normalized_type_names.get(s)
+    if normalized_name is None:
+        normalized_name = _normalize_type_str(s)
+        _normalized_type_names[s] = normalized_name
     return normalized_name
 
 
+def _normalize_type_str(s):
+    """
+    parse the type name into a tree of sections, then normalize the nodes bottom up.
+    a node is a [container name, sections, normalized name, type string] list for a
+    template or a std::function, its sections are the names of the plain sections and
+    the nodes of the other ones. the nested type strings are memoized like s
+    """
+    if s.find('<') == -1 and not s.startswith(_function_prefixes):
+        return s.strip()
+    root = [None, None, None, None]
+    nodes = []
+    pending = [(root, _scan_type_name(s), 0, len(s))]
+    while pending:
+        node, scan, start, end = pending.pop()
+        nodes.append(node)
+        s = scan[0]
+        if s.startswith(_function_prefixes, start, end):
+            # the signature is rebuilt into new strings, which are scanned on their own
+            s = s[start:end]
+            start = s.find('<')
+            assert (start > 0)
+            node[0] = s[:start]  # std::function
+            start += 1
+            ret_pos = s.find('(', start)
+            ret_type = s[start:ret_pos].strip()
+            end = s.find(')', ret_pos + 1)
+            args = 'std_function_args<' + s[ret_pos + 1:end].strip() + '>'
+            node[1] = sections = []
+            for section in (ret_type, args):
+                if section.find('<') == -1 and not section.startswith(_function_prefixes):
+                    sections.append(section)
+                elif section in _normalized_type_names:
+                    sections.append(_normalized_type_names[section])
+                else:
+                    child = [None, None, None, section]
+                    sections.append(child)
+                    pending.append((child, _scan_type_name(section), 0, len(section)))
+            continue
+
+        ranges = _get_sections(scan, start, end)
+        start, end = ranges[0]
+        if len(ranges) == 1:
+            node[2] = s[start:end]
+            continue
+
+        container_name = s[start:end]
+        if container_name in _string_names:
+            start, end = ranges[-1]
+            last_section = s[start:end].strip()
+            if last_section == '&' or last_section == '*' or last_section.startswith('::'):
+                node[2] = _string_names[container_name] + last_section
+            else:
+                node[2] = _string_names[container_name]
+            continue
+
+        node[0] = container_name
+        node[1] = sections = []
+        for start, end in islice(ranges, 1, None):
+            if s.find('<', start, end) == -1:
+                section = s[start:end].strip()
+                if not section.startswith(_function_prefixes):
+                    sections.append(section)
+                    continue
+            while s[start].isspace():
+                start += 1
+            while s[end - 1].isspace():
+                end -= 1
+            section = s[start:end]
+            if section in _normalized_type_names:
+                sections.append(_normalized_type_names[section])
+                continue
+            child = [None, None, None, section]
+            sections.append(child)
+            pending.append((child, scan, start, end))
+
+    # the nodes are expanded after their parent
+    for node in reversed(nodes):
+        if node[2] is None:
+            sections = [node[0]]
+            sections.extend([section[2] if section.__class__ is list else section for section in node[1]])
+            if sections[0] == 'std::function' or sections[0] == 'function' or sections[0] == 'std_function_args':
+                node[2] = normalize_std_function_by_sections(sections)
+            else:
+                node[2] = normalize_type_name_by_sections(sections)
+        if node[3] is not None:
+            _normalized_type_names[node[3]] = node[2]
+    return root[2]
+
+
 def native_name_from_type(type_cursor, underlying=False):
     kind = type_cursor.kind  # get_canonical().kind
     const = ""  # "const " if ntype.is_const_qualified() else ""
@@ -252,31 +362,67 @@ def native_name_from_type(type_cursor, underlying=False):
         # pdb.set_trace()
 
 
-def build_fullname(cursor, namespaces=[]):
+_scope_kinds = frozenset([cindex.CursorKind.NAMESPACE, cindex.CursorKind.CLASS_DECL])
+
+# scope cursor -> (names, namespace names, qualified name, namespace name) of
+# the scope and its enclosing scopes. only valid inside one translation unit.
+_scope_names = {}
+
+_empty_scope = ((), (), "", "")
+
+
+def clear_name_cache():
+    _scope_names.clear()
+    _normalized_type_names.clear()
+
+
+def _get_scope_names(scope):
     """
-    build the full namespace for a specific cursor
+    resolve the names of a namespace or class scope, outermost first.
+    each scope is resolved once, starting from the innermost cached parent
     """
+    pending = []
+    entry = _empty_scope
+    while scope and scope.kind in _scope_kinds:
+        # keyed by the cursor, equal hashes of other scopes are told apart by clang_equalCursors
+        cached = _scope_names.get(scope)
+        if cached is not None:
+            entry = cached
+            break
+        pending.append(scope)
+        scope = scope.semantic_parent
+
+    for scope in reversed(pending):
+        names = entry[0] + (scope.displayname,)
+        namespaces = entry[1]
+        namespace_name = entry[3]
+        if scope.kind == cindex.CursorKind.NAMESPACE:
+            namespaces = namespaces + (scope.displayname,)
+            namespace_name = "::".join(namespaces).replace("::__ndk1", "")
+        entry = (names, namespaces, "::".join(names).replace("::__ndk1", ""), namespace_name)
+        _scope_names[scope] = entry
+
+    return entry
+
+
+def _get_parent_scope_names(cursor):
     if cursor:
-        parent = cursor.semantic_parent
-        while parent and (parent.kind == cindex.CursorKind.NAMESPACE or parent.kind == cindex.CursorKind.CLASS_DECL):
-            namespaces.append(parent.displayname)
-            parent = parent.semantic_parent
+        return _get_scope_names(cursor.semantic_parent)
+    return _empty_scope
 
-        # if parent:
-        #     if parent.kind == cindex.CursorKind.NAMESPACE or parent.kind == cindex.CursorKind.CLASS_DECL:
-        #         namespaces.append(parent.displayname)
-        #         build_fullname(parent, namespaces)
 
+def build_fullname(cursor, namespaces=[]):
+    """
+    build the full namespace for a specific cursor
+    """
+    namespaces.extend(reversed(_get_parent_scope_names(cursor)[0]))
     return namespaces
 
 
 def get_fullname(cursor):
-    ns_list = build_fullname(cursor, [])
-    ns_list.reverse()
-    ns = "::".join(ns_list)
+    ns = _get_parent_scope_names(cursor)[2]
     display_name = cursor.displayname.replace("::__ndk1", "")
     if len(ns) > 0:
-        ns = ns.replace("::__ndk1", "")
         return ns + "::" + display_name
     return display_name
 
@@ -285,39 +431,58 @@ def build_namespace_list(cursor, namespaces=[]):
     """
     build the full namespace for a specific cursor
     """
-    if cursor:
-        parent = cursor.semantic_parent
-        while parent and (parent.kind == cindex.CursorKind.NAMESPACE or parent.kind == cindex.CursorKind.CLASS_DECL):
-            if parent.kind == cindex.CursorKind.NAMESPACE:
-                namespaces.append(parent.displayname)
-            parent = parent.semantic_parent
-        # if parent:
-        #     if parent.kind == cindex.CursorKind.NAMESPACE or parent.kind == cindex.CursorKind.CLASS_DECL:
-        #         if parent.kind == cindex.CursorKind.NAMESPACE:
-        #             namespaces.append(parent.displayname)
-        #         build_namespace_list(parent, namespaces)
+    namespaces.extend(reversed(_get_parent_scope_names(cursor)[1]))
     return namespaces
 
 
 def get_namespace_name(cursor):
-    ns_list = build_namespace_list(cursor, [])
-    ns_list.reverse()
-    ns = "::".join(ns_list)
+    return _get_parent_scope_names(cursor)[3]
 
-    if len(ns) > 0:
-        ns = ns.replace("::__ndk1", "")
-        return ns
+default_arg_kinds = frozenset(default_arg_type_arr)
+
+
+def _get_offset_location(tu, source_file, offset):
+    # None past the end of the file
+    location = cindex.SourceLocation.from_offset(tu, source_file, offset)
+    if location.file is None:
+        return None
+    return location
+
+
+def get_token_after(cursor):
+    """
+    the spelling of the first token after the extent of the cursor, None at the end of its file
+    """
+    end = cursor.extent.end
+    if not end.file:
+        return None
+    tu = cursor.translation_unit
+    window = 64
+    while True:
+        stop = _get_offset_location(tu, end.file, end.offset + window)
+        at_end = stop is None
+        if at_end:
+            # libclang doesn't tell the size of the file (which may be unsaved), find its last location
+            low, high = end.offset, end.offset + window
+            while high - low > 1:
+                middle = (low + high) // 2
+                if _get_offset_location(tu, end.file, middle) is None:
+                    high = middle
+                else:
+                    low = middle
+            stop = _get_offset_location(tu, end.file, low)
+        for token in cindex.TokenGroup.get_tokens(tu, cindex.SourceRange.from_locations(end, stop)):
+            if token.kind != cindex.TokenKind.COMMENT:
+                return token.spelling
+        if at_end:
+            return None
+        window *= 4
 
-    return ""
 
 # return True if found default argument.
 def iterate_param_node(param_node, depth=1):
-    for node in param_node.get_children():
-        # print(">"*depth+" "+str(node.kind))
-        if node.kind in default_arg_type_arr:
-            return True
-
-        if iterate_param_node(node, depth + 1):
-            return True
+    # the parameter itself is never one of the default argument kinds
+    for node in param_node.walk_preorder(kinds=default_arg_kinds):
+        return True
 
     return False
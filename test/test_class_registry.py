@@ -0,0 +1,100 @@
+import pickle
+import unittest
+from cparser.infos import ClassInfo, ClassRegistry
+
+
+class FakeMethod(object):
+    def __init__(self, func_name):
+        self.func_name = func_name
+
+
+def make_class(name, parents=(), methods=()):
+    # a parsed class without its cursor, like a detached one
+    nclass = ClassInfo.placeholder(name, "ns::" + name, "c:@N@ns@S@" + name)
+    nclass.is_placeholder = False
+    nclass.parents = list(parents)
+    nclass.bases = [(parent.class_name, parent.full_class_name, parent.usr) for parent in parents]
+    nclass.methods = [FakeMethod(method_name) for method_name in methods]
+    return nclass
+
+
+class ClassRegistryTest(unittest.TestCase):
+    def test_merge_links_placeholders(self):
+        registry = ClassRegistry()
+        base = ClassInfo.placeholder("Node", "ns::Node", "c:@N@ns@S@Node")
+        sprite = registry.merge(make_class("Sprite", [base]))
+        self.assertIs(sprite.parents[0], base)
+
+        node = registry.merge(make_class("Node"))
+        self.assertIs(sprite.parents[0], node)
+
+    def test_merge_returns_known_class(self):
+        registry = ClassRegistry()
+        node = registry.merge(make_class("Node"))
+        self.assertIs(registry.merge(make_class("Node")), node)
+
+    def test_remove_and_merge_keep_links_bounded(self):
+        registry = ClassRegistry()
+        node = registry.merge(make_class("Node"))
+        sprite = make_class("Sprite", [node])
+        for i in range(100):
+            registry.merge(sprite)
+            registry.remove(sprite)
+        registry.merge(sprite)
+        self.assertEqual(len(registry._links[node.usr]), 1)
+
+        registry.remove(sprite)
+        self.assertNotIn(node.usr, registry._links)
+        self.assertIsNone(registry.get(sprite.usr))
+
+    def test_removed_parent_is_relinked(self):
+        registry = ClassRegistry()
+        node = registry.merge(make_class("Node"))
+        sprite = registry.merge(make_class("Sprite", [node]))
+        registry.remove(node)
+        new_node = registry.merge(make_class("Node"))
+        self.assertIs(sprite.parents[0], new_node)
+
+    def test_is_ref_class(self):
+        registry = ClassRegistry()
+        ref = registry.merge(make_class("Ref"))
+        node = registry.merge(make_class("Node", [ref]))
+        sprite = registry.merge(make_class("Sprite", [node]))
+        other = registry.merge(make_class("Other"))
+        self.assertTrue(sprite._is_ref_class())
+        self.assertFalse(other._is_ref_class())
+        self.assertIn(id(sprite), registry._ref_classes)
+
+    def test_memoized_facts_follow_relinks(self):
+        registry = ClassRegistry()
+        base = ClassInfo.placeholder("Node", "ns::Node", "c:@N@ns@S@Node")
+        sprite = registry.merge(make_class("Sprite", [base], ["draw"]))
+        self.assertFalse(ClassInfo._is_method_in_parents(sprite, "getParent"))
+
+        registry.merge(make_class("Node", methods=["getParent"]))
+        self.assertTrue(ClassInfo._is_method_in_parents(sprite, "getParent"))
+        self.assertFalse(ClassInfo._is_method_in_parents(sprite, "draw"))
+
+    def test_class_without_registry(self):
+        node = make_class("Node", [make_class("Ref")], ["getParent"])
+        sprite = make_class("Sprite", [node])
+        self.assertTrue(sprite._is_ref_class())
+        self.assertTrue(ClassInfo._is_method_in_parents(sprite, "getParent"))
+
+    def test_pickle_leaves_registry_behind(self):
+        registry = ClassRegistry()
+        node = registry.merge(make_class("Node"))
+        sprite = registry.merge(make_class("Sprite", [node]))
+        loaded = pickle.loads(pickle.dumps(sprite, pickle.HIGHEST_PROTOCOL))
+        self.assertIsNot(loaded._registry, registry)
+        self.assertEqual(loaded._registry.classes, {})
+        self.assertEqual(loaded.parents[0].class_name, "Node")
+
+        other = ClassRegistry()
+        other.merge(loaded)
+        self.assertIs(loaded._registry, other)
+        self.assertIs(other.get(node.usr), loaded.parents[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+import unittest
+from clang import cindex
+from cparser.parser import Parser
+
+
+class IterDeclarationsTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        self.source_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.source_dir, "node.cpp")
+        with open(self.file_path, "w") as f:
+            f.write("namespace ns {\nclass Node {\n};\n}\nint visit(int x);\n")
+        self.tu = self.parser.index.parse(self.file_path, self.parser.clang_args)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def get_names(self, parsing_file):
+        self.parser._parsing_file = parsing_file
+        return [cursor.spelling for cursor in self.parser._iter_declarations(self.tu, self.tu.cursor)]
+
+    def test_main_file(self):
+        self.assertEqual(self.get_names(self.file_path), ["Node", "visit"])
+
+    def test_file_unknown_to_the_unit(self):
+        # falls back to comparing the file names of the cursors
+        self.assertEqual(self.get_names(os.path.join(self.source_dir, "other.cpp")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import gc
+import os
+import shutil
+import tempfile
+import unittest
+import weakref
+from clang import cindex
+from cparser.parser import Parser
+
+
+SOURCES = {
+    "node.cpp": "namespace ns {\nclass Node {\npublic:\n    void visit();\n};\n}\n",
+    "widget.cpp": "namespace ui {\nclass Widget {\npublic:\n    void draw();\n};\n}\n"
+}
+
+
+class TrackingParser(Parser):
+    """
+    counts the translation units alive whenever one is loaded
+    """
+
+    def __init__(self, opts):
+        Parser.__init__(self, opts)
+        self.units = []
+        self.alive_counts = []
+
+    def _load_translation_unit(self, file_path):
+        self.alive_counts.append(sum(1 for unit in self.units if unit() is not None))
+        tu = Parser._load_translation_unit(self, file_path)
+        self.units.append(weakref.ref(tu))
+        return tu
+
+
+class DetachTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.file_paths = []
+        for file_name in sorted(SOURCES):
+            file_path = os.path.join(self.source_dir, file_name)
+            with open(file_path, "w") as f:
+                f.write(SOURCES[file_name])
+            self.file_paths.append(file_path)
+        # no cycle may keep a unit alive either
+        gc.disable()
+
+    def tearDown(self):
+        gc.enable()
+        shutil.rmtree(self.source_dir)
+
+    def make_parser(self):
+        try:
+            return TrackingParser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None, 'detach': True})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+
+    def test_parse_file_frees_the_unit(self):
+        parser = self.make_parser()
+        for file_path in self.file_paths + self.file_paths:
+            parser.parse_file(file_path)
+        self.assertEqual(parser.alive_counts, [0, 0, 0, 0])
+        self.assertEqual(parser.parsed_classes.keys(), ["Node", "Widget"])
+
+    def test_iter_declarations_frees_the_unit(self):
+        parser = self.make_parser()
+        models = list(parser.iter_declarations(self.file_paths + self.file_paths))
+        self.assertEqual(parser.alive_counts, [0, 0, 0, 0])
+        self.assertEqual([model.class_name for model in models], ["Node", "Widget"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import pickle
+import unittest
+from clang import cindex
+from cparser.diagnostics import DiagnosticInfo, DiagnosticCollector, ParseError
+
+
+class FakeFile(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeLocation(object):
+    def __init__(self, file_name, line, column=1):
+        self.file = FakeFile(file_name) if file_name else None
+        self.line = line
+        self.column = column
+
+
+class FakeDiagnostic(object):
+    def __init__(self, severity, message, line, category=1, file_name="a.h"):
+        self.severity = severity
+        self.spelling = message
+        self.location = FakeLocation(file_name, line)
+        self.category_number = category
+        self.category_name = "category %d" % category
+        self.option = ""
+
+
+class FakeTranslationUnit(object):
+    def __init__(self, diagnostics):
+        self.diagnostics = diagnostics
+
+
+def error(message, line, category=1):
+    return FakeDiagnostic(cindex.Diagnostic.Error, message, line, category)
+
+
+def warning(message, line, category=1):
+    return FakeDiagnostic(cindex.Diagnostic.Warning, message, line, category)
+
+
+class DiagnosticCollectorTest(unittest.TestCase):
+    def test_min_severity(self):
+        tu = FakeTranslationUnit([warning("w", 1), error("e", 2)])
+        report = DiagnosticCollector("error").collect(tu)
+        self.assertTrue(report.has_errors)
+        self.assertEqual([d.message for d in report.diagnostics], ["e"])
+
+        report = DiagnosticCollector("warning").collect(tu)
+        self.assertEqual([d.message for d in report.diagnostics], ["w", "e"])
+
+    def test_no_errors(self):
+        report = DiagnosticCollector("warning").collect(FakeTranslationUnit([warning("w", 1)]))
+        self.assertFalse(report.has_errors)
+        self.assertEqual(len(report.diagnostics), 1)
+
+    def test_duplicates(self):
+        tu = FakeTranslationUnit([error("e", 1), error("e", 1), error("e", 2)])
+        report = DiagnosticCollector().collect(tu)
+        self.assertEqual([d.line for d in report.diagnostics], [1, 2])
+        self.assertEqual(report.duplicates, 1)
+
+    def test_category_limit(self):
+        tu = FakeTranslationUnit([error("e%d" % i, i, category=1) for i in range(5)] + [error("other", 9, category=2)])
+        report = DiagnosticCollector(category_limit=2, error_limit=None).collect(tu)
+        self.assertEqual([d.message for d in report.diagnostics], ["e0", "e1", "other"])
+        self.assertEqual(report.suppressed, {"category 1": 3})
+
+    def test_error_limit(self):
+        tu = FakeTranslationUnit([error("e%d" % i, i, category=i) for i in range(5)])
+        report = DiagnosticCollector(category_limit=None, error_limit=3).collect(tu)
+        self.assertEqual(len(report.diagnostics), 3)
+        self.assertTrue(report.truncated)
+
+        report = DiagnosticCollector(category_limit=None, error_limit=5).collect(tu)
+        self.assertEqual(len(report.diagnostics), 5)
+        self.assertFalse(report.truncated)
+
+
+class ParseErrorTest(unittest.TestCase):
+    def test_message(self):
+        diagnostics = [DiagnosticInfo(cindex.Diagnostic.Error, "Semantic Issue", "a.h", 3, 7, "unknown type", "")]
+        e = ParseError("a.cpp", diagnostics)
+        self.assertEqual(str(e), "Fatal error in parsing headers: a.cpp (1 errors, first: a.h:3:7: error: unknown type)")
+
+    def test_pickle(self):
+        # the workers of Parser.parse_files send the error back pickled
+        diagnostics = [DiagnosticInfo(cindex.Diagnostic.Fatal, "Lexical Issue", "a.h", 1, 2, "file not found", "")]
+        e = ParseError("a.cpp", diagnostics, "Failed")
+        # the slots of DiagnosticInfo need protocol 2, which multiprocessing uses
+        for protocol in range(2, pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(e, protocol))
+            self.assertIsInstance(loaded, ParseError)
+            self.assertEqual(str(loaded), str(e))
+            self.assertEqual(loaded.file_path, "a.cpp")
+            self.assertEqual(loaded.to_dicts(), e.to_dicts())
+
+
+if __name__ == '__main__':
+    unittest.main()
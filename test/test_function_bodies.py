@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+from clang import cindex
+from cparser.parser import Parser
+
+
+SOURCE = """
+class Node {
+public:
+    Node() : _tag(0) { }
+    void visit() { _tag++; }
+    void draw();
+    virtual void update() = 0;
+    void setTag(int tag)
+    // the tag is not validated
+    {
+        _tag = tag;
+    }
+    int getTag() const;
+private:
+    int _tag;
+};
+
+void Node::draw()
+{
+}
+
+inline int twice(int x) { return x * 2; }
+int half(int x);
+inline int last(int x) { return x; }"""
+
+
+class FunctionBodiesTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.source_dir, "node.cpp")
+        with open(self.file_path, "w") as f:
+            f.write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def parse(self, skip_function_bodies):
+        try:
+            parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None,
+                             'skip_function_bodies': skip_function_bodies})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        parser.parse_file(self.file_path)
+        methods = [(method.func_name, method.is_implement) for method in parser.parsed_classes["Node"].methods]
+        functions = [(function.func_name, function.is_implement) for function in parser.methods]
+        return methods, functions
+
+    def test_is_implement(self):
+        expected = (
+            [("Node", True), ("visit", True), ("draw", False), ("update", False), ("setTag", True),
+             ("getTag", False)],
+            [("draw", True), ("twice", True), ("half", False), ("last", True)]
+        )
+        self.assertEqual(self.parse(False), expected)
+        self.assertEqual(self.parse(True), expected)
+
+
+    def test_skip_function_bodies(self):
+        # only the bodies are skipped, the declarations are the same
+        methods, functions = self.parse(True)
+        self.assertEqual([name for name, is_implement in methods],
+                         ["Node", "visit", "draw", "update", "setTag", "getTag"])
+        self.assertEqual([name for name, is_implement in functions], ["draw", "twice", "half", "last"])
+
+
+if __name__ == '__main__':
+    unittest.main()
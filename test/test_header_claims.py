@@ -0,0 +1,132 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from clang import cindex
+from cparser.infos import ClassInfo, ClassRegistry
+from cparser.parser import Parser
+from cparser.project import HeaderClaims, ClaimsManager
+
+
+SOURCES = {
+    "node.h": "class Node {\npublic:\n    void visit();\n};\n",
+    "a.cpp": "#include \"node.h\"\nclass A : public Node {\npublic:\n    void draw();\n};\n",
+    "b.cpp": "#include \"node.h\"\nclass B : public Node {\npublic:\n    void draw();\n};\n"
+}
+
+
+def make_class(name):
+    nclass = ClassInfo.placeholder(name, name, "c:@S@" + name)
+    nclass.is_placeholder = False
+    return nclass
+
+
+def make_models(*names):
+    return [(name, make_class(name)) for name in names], []
+
+
+class HeaderDirsTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        for file_name, source in SOURCES.iteritems():
+            with open(os.path.join(self.source_dir, file_name), "w") as f:
+                f.write(source)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def parse(self, header_dirs):
+        try:
+            parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None, 'header_dirs': header_dirs})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        for file_name in ("a.cpp", "b.cpp"):
+            parser.parse_file(os.path.join(self.source_dir, file_name))
+        return parser
+
+    def test_headers_extracted(self):
+        parser = self.parse([self.source_dir])
+        self.assertEqual(sorted(parser.parsed_classes.keys()), ["A", "B", "Node"])
+        self.assertEqual([method.func_name for method in parser.parsed_classes["Node"].methods], ["visit"])
+
+    def test_without_header_dirs(self):
+        parser = self.parse(None)
+        self.assertEqual(sorted(parser.parsed_classes.keys()), ["A", "B"])
+
+
+class HeaderClaimsTest(unittest.TestCase):
+    def check_claims(self, claims):
+        self.assertEqual(claims.claim([("a.h", ()), ("b.h", ())], "a.cpp"), [("a.h", ()), ("b.h", ())])
+        self.assertEqual(claims.claim([("b.h", ()), ("c.h", ()), ("b.h", ("-DX",))], "b.cpp"),
+                         [("c.h", ()), ("b.h", ("-DX",))])
+        # the owner claiming again keeps its keys
+        self.assertEqual(claims.claim([("a.h", ())], "a.cpp"), [("a.h", ())])
+        self.assertEqual(claims.get_claims()[("b.h", ())], "a.cpp")
+
+    def test_claim(self):
+        self.check_claims(HeaderClaims())
+
+    def test_claim_through_manager(self):
+        manager = ClaimsManager()
+        manager.start()
+        try:
+            self.check_claims(manager.HeaderClaims())
+        finally:
+            manager.shutdown()
+
+
+class MergeTaskResultsTest(unittest.TestCase):
+    def make_parser(self):
+        parser = Parser.__new__(Parser)
+        parser.header_dirs = ("/p/",)
+        parser.placed_headers = set()
+        parser.parsed_classes = OrderedDict()
+        parser.methods = []
+        parser.class_registry = ClassRegistry()
+        parser.stats = None
+        return parser
+
+    def test_header_models_follow_first_includer(self):
+        args_a = ["-DA"]
+        args_b = ["-DB"]
+        tasks = [("/p/a.cpp", args_a), ("/p/b.cpp", args_a), ("/p/c.cpp", args_b)]
+        # b.cpp won the claim of h2.h, and c.cpp extracted h1.h again with its own args
+        results = [
+            make_models("A") + (None, (["/p/h1.h", "/p/h2.h"], {("/p/h1.h", ("-DA",)): make_models("H1")}), None),
+            make_models("B") + (None, (["/p/h2.h", "/p/h3.h"], {("/p/h2.h", ("-DA",)): make_models("H2"),
+                                                                 ("/p/h3.h", ("-DA",)): make_models("H3")}), None),
+            make_models("C") + (None, (["/p/h1.h"], {("/p/h1.h", ("-DB",)): make_models("H1")}), None)
+        ]
+        parser = self.make_parser()
+        parser._merge_task_results(tasks, results)
+        self.assertEqual(parser.parsed_classes.keys(), ["A", "H1", "H2", "B", "H3", "C"])
+        self.assertIs(parser.parsed_classes["H1"], results[0][3][1][("/p/h1.h", ("-DA",))][0][0][1])
+        self.assertEqual(parser.placed_headers, set(["/p/h1.h", "/p/h2.h", "/p/h3.h"]))
+
+    def test_without_headers(self):
+        parser = self.make_parser()
+        parser.header_dirs = None
+        results = iter([make_models("A") + (None, None, None), make_models("B") + (None, None, None)])
+        parser._merge_task_results([("a.cpp", []), ("b.cpp", [])], results)
+        self.assertEqual(parser.parsed_classes.keys(), ["A", "B"])
+
+    def test_worker_profiles_are_summed(self):
+        parser = self.make_parser()
+        parser.header_dirs = None
+        cindex.reset_libclang_profile()
+        results = [
+            make_models("A") + (None, None, [("clang_parseTranslationUnit", 1, 2.0, 1.5)]),
+            make_models("B") + (None, None, [("clang_parseTranslationUnit", 2, 3.0, 2.5),
+                                             ("clang_getCursorKind", 10, 0.5, 0.5)])
+        ]
+        try:
+            parser._merge_task_results([("a.cpp", []), ("b.cpp", [])], results)
+            self.assertEqual(cindex.get_libclang_profile(), [("clang_parseTranslationUnit", 3, 5.0, 4.0),
+                                                             ("clang_getCursorKind", 10, 0.5, 0.5)])
+        finally:
+            cindex.reset_libclang_profile()
+
+
+if __name__ == '__main__':
+    unittest.main()
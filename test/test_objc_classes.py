@@ -0,0 +1,46 @@
+import os
+import shutil
+import tempfile
+import unittest
+from clang import cindex
+from cparser.parser import Parser
+
+
+SOURCE = """
+@protocol Drawing
+@end
+
+@interface Node
+@end
+
+@interface Sprite : Node <Drawing>
+-(void) draw;
+@end
+"""
+
+
+class ObjcClassesTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.parser = Parser({'clang_args': ['-x', 'objective-c'], 'win32_clang_flags': None})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        self.source_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.source_dir, "sprite.m")
+        with open(self.file_path, "w") as f:
+            f.write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def test_superclass_and_protocol(self):
+        self.parser.parse_file(self.file_path)
+        node = self.parser.parsed_classes["Node"]
+        sprite = self.parser.parsed_classes["Sprite"]
+        self.assertEqual(sprite.bases, [("Node", "Node", "c:objc(cs)Node")])
+        self.assertIs(sprite.parents[0], node)
+        self.assertEqual([method.func_name for method in sprite.methods], ["draw"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+from clang import cindex
+from cparser.parser import Parser
+
+
+class PrefixHeaderTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.prefix_header = os.path.join(self.source_dir, "prefix.h")
+        with open(self.prefix_header, "w") as f:
+            f.write("class Ref {\npublic:\n    void retain();\n};\n")
+        self.file_path = os.path.join(self.source_dir, "node.cpp")
+        with open(self.file_path, "w") as f:
+            f.write("class Node : public Ref {\npublic:\n    void visit();\n};\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def test_prefix_header(self):
+        try:
+            parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None,
+                             'prefix_header': self.prefix_header, 'pch_dir': os.path.join(self.source_dir, "pch")})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        self.assertEqual(parser.clang_args.count('-include-pch'), 1)
+        # Ref comes from the precompiled header
+        parser.parse_file(self.file_path)
+        self.assertEqual(parser.parsed_classes.keys(), ["Node"])
+
+    def test_parsers_sharing_opts(self):
+        opts = {'clang_args': ['-x', 'c++'], 'win32_clang_flags': None, 'prefix_header': self.prefix_header,
+                'pch_dir': os.path.join(self.source_dir, "pch")}
+        try:
+            parsers = [Parser(opts), Parser(opts)]
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        self.assertEqual(opts['clang_args'], ['-x', 'c++'])
+        for parser in parsers:
+            self.assertEqual(parser.clang_args.count('-include-pch'), 1)
+            self.assertEqual(parser._base_clang_args, ['-x', 'c++'])
+        self.assertEqual(parsers[0].clang_args, parsers[1].clang_args)
+
+        parsers[1].parse_file(self.file_path)
+        self.assertEqual(parsers[1].parsed_classes["Node"].parents[0].class_name, "Ref")
+
+
+if __name__ == '__main__':
+    unittest.main()
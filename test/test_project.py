@@ -0,0 +1,60 @@
+import unittest
+from cparser import project
+
+
+class FakeCommand(object):
+    def __init__(self, directory, filename, arguments):
+        self.directory = directory
+        self.filename = filename
+        self.arguments = iter(arguments)
+
+
+class CommandArgsTest(unittest.TestCase):
+    def test_strip_build_options(self):
+        args = project.get_command_args(
+            ["/usr/bin/c++", "-DFOO", "-std=c++11", "-o", "obj/a.o", "-c", "src/a.cpp", "-MD", "-MF", "a.d",
+             "-MTa.o", "-oother.o", "-fobjc-arc"],
+            "/build/src/a.cpp", "/build")
+        self.assertEqual(args, ["-DFOO", "-std=c++11", "-fobjc-arc"])
+
+    def test_absolute_paths(self):
+        args = project.get_command_args(
+            ["clang++", "-Iinclude", "-I", "../ext", "-isystem", "/usr/include/x", "-include", "prefix.h",
+             "--sysroot=sdk", "a.cpp"],
+            "/build/a.cpp", "/build")
+        self.assertEqual(args, ["-I/build/include", "-I", "/ext", "-isystem", "/usr/include/x",
+                                "-include", "/build/prefix.h", "--sysroot=/build/sdk"])
+
+    def test_compiler_wrappers(self):
+        for launcher in (["ccache"], ["/usr/bin/distcc"], ["sccache.exe"], ["ccache", "distcc"]):
+            args = project.get_command_args(launcher + ["g++", "-DFOO", "-c", "a.cpp"], "/build/a.cpp", "/build")
+            self.assertEqual(args, ["-DFOO"])
+
+
+class GroupCommandsTest(unittest.TestCase):
+    def test_group_by_args(self):
+        commands = [
+            FakeCommand("/build", "a.cpp", ["c++", "-DA", "-c", "a.cpp", "-o", "a.o"]),
+            FakeCommand("/build", "b.cpp", ["c++", "-DB", "-c", "b.cpp", "-o", "b.o"]),
+            FakeCommand("/build", "c.cpp", ["ccache", "c++", "-DA", "-c", "c.cpp", "-o", "c.o"]),
+            # a file built twice keeps the args of its first command
+            FakeCommand("/build", "a.cpp", ["c++", "-DB", "-c", "a.cpp", "-o", "a2.o"]),
+            FakeCommand("/build/sub", "../d.cpp", ["c++", "-DB", "-c", "../d.cpp"])
+        ]
+        groups = project.group_commands(commands)
+        self.assertEqual(groups.items(), [
+            (("-DA",), ["/build/a.cpp", "/build/c.cpp"]),
+            (("-DB",), ["/build/b.cpp", "/build/d.cpp"])
+        ])
+
+    def test_file_filter(self):
+        commands = [
+            FakeCommand("/build", "src/a.cpp", ["c++", "-c", "src/a.cpp"]),
+            FakeCommand("/build", "external/b.cpp", ["c++", "-c", "external/b.cpp"])
+        ]
+        groups = project.group_commands(commands, lambda file_path: "/external/" not in file_path)
+        self.assertEqual(groups.items(), [((), ["/build/src/a.cpp"])])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from clang import cindex
+from cparser.infos import TypeInfo, FieldInfo, FunctionInfo, ClassInfo, LocationInfo, FieldAttributes
+from cparser.parser import Parser
+from cparser.serializer import ModelWriter, ModelReader, get_parser_models
+
+
+SOURCE = """
+class Ref {
+public:
+    void retain();
+};
+
+class Node : public Ref {
+public:
+    void setTag(int tag);
+    int getTag() const;
+private:
+    int _tag;
+};
+
+Node *createNode();
+"""
+
+
+def round_trip(models):
+    stream = StringIO()
+    ModelWriter(stream).write_all(models)
+    stream.seek(0)
+    return ModelReader(stream)
+
+
+def make_type(name):
+    nt = TypeInfo()
+    nt.name = name
+    nt.fullname = name
+    nt.is_numeric = name == "int"
+    return nt
+
+
+def make_field(name, nt, line):
+    field = FieldInfo.__new__(FieldInfo)
+    field.cursor = None
+    field.name = name
+    field.kind = cindex.TypeKind.INT
+    field.location = LocationInfo("node.h", line, 9)
+    field.signature_name = name
+    field.field_type = nt
+    field.attributes = FieldAttributes.Private
+    return field
+
+
+def make_function(name, class_name, ret_type, arguments, line):
+    function = FunctionInfo.__new__(FunctionInfo)
+    function.cursor = None
+    function.func_name = name
+    function.signature_name = name
+    function.arguments = [nt for arg_name, nt in arguments]
+    function.argumentTips = [arg_name for arg_name, nt in arguments]
+    function.implementations = []
+    function.is_overloaded = False
+    function.is_constructor = False
+    function.not_supported = False
+    function.is_override = False
+    function.ret_type = ret_type
+    function.comment = ""
+    function.attributes = 0
+    function.class_name = class_name
+    function.min_args = len(arguments)
+    function.namespace_name = "ns"
+    function.file_path = "node.h"
+    function.usr = "c:@F@" + name
+    function._extent_start_line = line
+    function._extent_end_line = line
+    function._location = LocationInfo("node.h", line, 5)
+    return function
+
+
+def make_class(name, parents, line):
+    nclass = ClassInfo.placeholder(name, "ns::" + name, "c:@N@ns@S@" + name)
+    nclass.is_placeholder = False
+    nclass.parents = list(parents)
+    nclass.bases = [(parent.class_name, parent.full_class_name, parent.usr) for parent in parents]
+    nclass.namespace_name = "ns"
+    nclass.file_path = "node.h"
+    nclass.line = line
+    nclass._location = LocationInfo("node.h", line, 7)
+    return nclass
+
+
+class ParsedModelsTest(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.source_dir, "node.cpp")
+        with open(self.file_path, "w") as f:
+            f.write(SOURCE)
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir)
+
+    def test_parsed_models(self):
+        try:
+            parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+        parser.parse_file(self.file_path)
+
+        models = list(round_trip(get_parser_models(parser)))
+        self.assertEqual([type(model) for model in models], [ClassInfo, ClassInfo, FunctionInfo])
+        ref, node, function = models
+        self.assertEqual(node.class_name, "Node")
+        self.assertEqual([method.func_name for method in node.methods], ["setTag", "getTag"])
+        self.assertEqual([field.name for field in node.fields], ["_tag"])
+        # types are shared by index
+        self.assertIs(node.methods[0].arguments[0], node.fields[0].field_type)
+        self.assertEqual(function.func_name, "createNode")
+        self.assertTrue(function.ret_type.is_pointer)
+
+
+class SerializerTest(unittest.TestCase):
+    def setUp(self):
+        int_type = make_type("int")
+        self.ref = make_class("Ref", [], 1)
+        self.node = make_class("Node", [self.ref], 10)
+        self.node.fields.append(make_field("_tag", int_type, 12))
+        self.node.methods.append(make_function("setTag", "ns::Node", make_type("void"), [("tag", int_type)], 11))
+        self.sprite = make_class("Sprite", [self.node], 20)
+        self.function = make_function("createSprite", None, make_type("Sprite *"), [], 30)
+
+    def test_round_trip(self):
+        models = list(round_trip([self.ref, self.node, self.sprite, self.function]))
+        self.assertEqual([type(model) for model in models], [ClassInfo, ClassInfo, ClassInfo, FunctionInfo])
+        ref, node, sprite, function = models
+
+        self.assertIs(node.parents[0], ref)
+        self.assertIs(sprite.parents[0], node)
+        self.assertEqual(node.bases, [("Ref", "ns::Ref", "c:@N@ns@S@Ref")])
+        self.assertEqual(node.fields[0].field_type.name, "int")
+        # types are shared by index
+        self.assertIs(node.methods[0].arguments[0], node.fields[0].field_type)
+        self.assertEqual(node.methods[0].argumentTips, ["tag"])
+        self.assertEqual(function.ret_type.name, "Sprite *")
+
+    def test_locations(self):
+        ref, node, sprite, function = round_trip([self.ref, self.node, self.sprite, self.function])
+        self.assertEqual(node.get_location(), LocationInfo("node.h", 10, 7))
+        self.assertEqual(node.fields[0].location, LocationInfo("node.h", 12, 9))
+        self.assertEqual(node.methods[0].get_location(), LocationInfo("node.h", 11, 5))
+        self.assertEqual(function.get_location(), LocationInfo("node.h", 30, 5))
+        self.assertEqual((function.get_extent_start_line(), function.get_extent_end_line()), (30, 30))
+
+    def test_parent_written_later(self):
+        models = iter(round_trip([self.sprite, self.node, self.ref]))
+
+        sprite = next(models)
+        # a placeholder stands for the parent until it is read
+        self.assertTrue(sprite.parents[0].is_placeholder)
+        self.assertEqual(sprite.parents[0].full_class_name, "ns::Node")
+        self.assertEqual(sprite.parents[0].usr, "c:@N@ns@S@Node")
+        self.assertFalse(sprite._is_ref_class())
+
+        node = next(models)
+        self.assertIs(sprite.parents[0], node)
+        self.assertTrue(node.parents[0].is_placeholder)
+
+        ref = next(models)
+        self.assertIs(node.parents[0], ref)
+        self.assertTrue(sprite._is_ref_class())
+
+    def test_parent_never_written(self):
+        sprite, = list(round_trip([self.sprite]))
+        self.assertTrue(sprite.parents[0].is_placeholder)
+        self.assertEqual(sprite.parents[0].class_name, "Node")
+
+    def test_not_a_model_stream(self):
+        reader = ModelReader(StringIO('{"record": "class"}\n'))
+        self.assertRaises(Exception, list, reader)
+
+
+if __name__ == '__main__':
+    unittest.main()
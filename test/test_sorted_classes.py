@@ -0,0 +1,84 @@
+import unittest
+from collections import OrderedDict
+from cparser.infos import ClassInfo
+from cparser.parser import Parser
+
+
+def make_class(full_name, bases=(), usr=True):
+    name = full_name.split("::")[-1]
+    nclass = ClassInfo.placeholder(name, full_name, "c:@S@" + full_name if usr else None)
+    nclass.is_placeholder = False
+    nclass.bases = [(base.split("::")[-1], base, "c:@S@" + base if usr else None) for base in bases]
+    return nclass
+
+
+def make_parser(classes):
+    parser = Parser.__new__(Parser)
+    parser.parsed_classes = OrderedDict((nclass.class_name, nclass) for nclass in classes)
+    return parser
+
+
+class SortedClassesTest(unittest.TestCase):
+    def test_bases_first(self):
+        parser = make_parser([
+            make_class("ns::Sprite", ["ns::Node"]),
+            make_class("ns::Label", ["ns::Node", "ns::Protocol"]),
+            make_class("ns::Node", ["ns::Ref"]),
+            make_class("ns::Protocol"),
+            make_class("ns::Ref")
+        ])
+        self.assertEqual(parser.sorted_classes(), ["Protocol", "Ref", "Node", "Sprite", "Label"])
+
+    def test_parents_first(self):
+        graph = OrderedDict([
+            ("Sprite", ["Node"]),
+            ("Label", ["Node", "Protocol"]),
+            ("Node", ["Ref"]),
+            ("Protocol", []),
+            ("Ref", [])
+        ])
+        self.assertEqual(make_parser([]).sorted_classes(graph), ["Protocol", "Ref", "Node", "Sprite", "Label"])
+
+    def test_unrelated_classes_keep_their_order(self):
+        graph = OrderedDict([("C", []), ("A", []), ("B", ["C"])])
+        self.assertEqual(make_parser([]).sorted_classes(graph), ["C", "A", "B"])
+
+    def test_cycle(self):
+        graph = OrderedDict([("A", ["B"]), ("B", ["A"])])
+        self.assertRaises(Exception, make_parser([]).sorted_classes, graph)
+
+    def test_full_name_without_usr(self):
+        parser = make_parser([make_class("ns::Sprite", ["ns::Node"], usr=False), make_class("ns::Node", usr=False)])
+        self.assertEqual(parser.inheritance_graph(), OrderedDict([("Sprite", ["Node"]), ("Node", [])]))
+
+    def test_same_name_is_not_a_base(self):
+        # ui::Widget derives from an unparsed ext::Node, not from the parsed ns::Node
+        parser = make_parser([make_class("ui::Widget", ["ext::Node"]), make_class("ns::Node", ["ui::Widget"])])
+        unresolved = {}
+        graph = parser.inheritance_graph(unresolved)
+        self.assertEqual(graph, OrderedDict([("Widget", []), ("Node", ["Widget"])]))
+        self.assertEqual(unresolved, {"Widget": ["ext::Node"]})
+        self.assertEqual(parser.sorted_classes(graph), ["Widget", "Node"])
+
+    def test_parent_outside_of_graph(self):
+        graph = OrderedDict([("B", ["A", "Unknown"]), ("A", [])])
+        self.assertEqual(make_parser([]).sorted_classes(graph), ["A", "B"])
+
+    def test_cycle_reports_its_classes_only(self):
+        graph = OrderedDict([
+            ("A", ["B"]),
+            ("B", ["A"]),
+            ("C", ["A"]),
+            ("D", ["D"]),
+            ("E", [])
+        ])
+        try:
+            make_parser([]).sorted_classes(graph)
+        except Exception as e:
+            self.assertEqual(str(e), "Inheritance cycle between classes: A, B; D")
+        else:
+            self.fail("no cycle found")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from clang import cindex
+from cparser.parser import Parser
+from cparser.symbol_index import SymbolIndex
+
+
+class FakeType(object):
+    def __init__(self, name):
+        self.name = name
+        self.fullname = "ns::" + name
+        self.whole_name = None
+
+
+class FakeField(object):
+    def __init__(self, name, type_name):
+        self.name = name
+        self.field_type = FakeType(type_name)
+        self.attributes = 0
+
+
+class FakeMethod(object):
+    def __init__(self, class_name, name, ret_type_name, arguments=()):
+        self.class_name = class_name
+        self.func_name = name
+        self.namespace_name = "ns"
+        self.usr = "c:@N@ns@S@%s@F@%s" % (class_name, name)
+        self.ret_type = FakeType(ret_type_name)
+        self.attributes = 0
+        self.min_args = len(arguments)
+        self.argumentTips = [arg_name for arg_name, type_name in arguments]
+        self.arguments = [FakeType(type_name) for arg_name, type_name in arguments]
+
+    def get_extent_start_line(self):
+        return 1
+
+    def get_extent_end_line(self):
+        return 1
+
+
+class FakeClass(object):
+    def __init__(self, name, bases=(), fields=(), methods=()):
+        self.class_name = name
+        self.full_class_name = "ns::" + name
+        self.namespace_name = "ns"
+        self.usr = "c:@N@ns@S@" + name
+        self.line = 1
+        self.bases = [(base, "ns::" + base, "c:@N@ns@S@" + base) for base in bases]
+        self.fields = list(fields)
+        self.static_fields = []
+        self.methods = list(methods)
+
+
+class FakeParser(object):
+    """
+    yields the classes given per file, raises once the classes of a file run out if asked
+    """
+
+    def __init__(self, declarations, failing=(), includes=None):
+        self.clang_args = ["-x", "c++"]
+        self.declarations = declarations
+        self.failing = failing
+        self.includes = includes or {}
+
+    def iter_declarations(self, file_paths):
+        for file_path in file_paths:
+            for declaration in self.declarations[file_path]:
+                yield declaration
+            if file_path in self.failing:
+                raise Exception("failed to parse %s" % file_path)
+
+    def get_dependencies(self, file_path):
+        return dict((include_path, os.path.getmtime(include_path)) for include_path in self.includes.get(file_path, ()))
+
+
+class SymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.index = SymbolIndex(":memory:")
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.temp_dir)
+
+    def make_file(self, name):
+        file_path = os.path.join(self.temp_dir, name)
+        with open(file_path, "w") as f:
+            f.write("// " + name)
+        return file_path
+
+    def touch(self, file_path):
+        mtime = os.path.getmtime(file_path) + 10
+        os.utime(file_path, (mtime, mtime))
+
+    def field_type(self, class_name, field_name):
+        return self.index.db.execute("SELECT t.name FROM fields f JOIN classes c ON c.id = f.class_id "
+                                     "JOIN types t ON t.id = f.type_id WHERE c.name = ? AND f.name = ?",
+                                     (class_name, field_name)).fetchone()[0]
+
+    def test_update_and_query(self):
+        a = self.make_file("a.h")
+        parser = FakeParser({a: [
+            FakeClass("Base", methods=[FakeMethod("Base", "getName", "string")]),
+            FakeClass("Node", bases=["Base"], methods=[FakeMethod("Node", "addChild", "void", [("child", "Node")])]),
+            FakeClass("Sprite", bases=["Node"])
+        ]})
+        self.assertTrue(self.index.update_file(parser, a))
+        self.assertFalse(self.index.update_file(parser, a))
+
+        self.assertEqual(self.index.derived_classes("Base"), ["ns::Node", "ns::Sprite"])
+        self.assertEqual(self.index.base_classes("Sprite"), [("Node", "ns::Node", "c:@N@ns@S@Node")])
+        self.assertEqual([row[1] for row in self.index.methods_taking("Node")], ["addChild"])
+        self.assertEqual([row[1] for row in self.index.methods_returning("string")], ["getName"])
+
+        self.index.remove_file(a)
+        self.assertEqual(self.index.find_classes("Base"), [])
+
+    def test_failed_update_rolls_back(self):
+        a = self.make_file("a.h")
+        b = self.make_file("b.h")
+        c = self.make_file("c.h")
+        parser = FakeParser({
+            a: [FakeClass("A", fields=[FakeField("fa", "TypeA")])],
+            b: [FakeClass("B", fields=[FakeField("fb", "TypeB")])],
+            c: [FakeClass("C", fields=[FakeField("fb2", "TypeA")])]
+        }, failing=[a])
+
+        self.assertRaises(Exception, self.index.update_file, parser, a)
+        self.assertEqual(self.index.find_classes("A"), [])
+
+        self.index.update_file(parser, b)
+        self.index.update_file(parser, c)
+        # the id of TypeA was rolled back and given to TypeB
+        self.assertEqual(self.field_type("B", "fb"), "TypeB")
+        self.assertEqual(self.field_type("C", "fb2"), "TypeA")
+
+    def test_changed_header(self):
+        a = self.make_file("a.cpp")
+        header = self.make_file("a.h")
+        parser = FakeParser({a: [FakeClass("A")]}, includes={a: [header]})
+        self.assertTrue(self.index.update_file(parser, a))
+        self.assertTrue(self.index.is_up_to_date(a, parser.clang_args))
+
+        self.touch(header)
+        self.assertFalse(self.index.is_up_to_date(a, parser.clang_args))
+        self.assertTrue(self.index.update_file(parser, a))
+        self.assertFalse(self.index.update_file(parser, a))
+
+        os.remove(header)
+        self.assertFalse(self.index.is_up_to_date(a, parser.clang_args))
+
+    def test_parser_dependencies(self):
+        header = self.make_file("node.h")
+        with open(header, "w") as f:
+            f.write("class Node {};\n")
+        main = self.make_file("sprite.cpp")
+        with open(main, "w") as f:
+            f.write('#include "node.h"\nclass Sprite : public Node {};\n')
+        try:
+            parser = Parser({'clang_args': ['-x', 'c++'], 'win32_clang_flags': None, 'detach': True})
+        except cindex.LibclangError as e:
+            self.skipTest(str(e))
+
+        self.assertTrue(self.index.update_file(parser, main))
+        self.assertEqual(parser.get_dependencies(main).keys(), [header])
+        self.assertFalse(self.index.update_file(parser, main))
+        self.touch(header)
+        self.assertTrue(self.index.update_file(parser, main))
+        self.assertEqual([row[0] for row in self.index.find_classes("Sprite")], ["Sprite"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import unittest
+from clang import cindex
+from cparser import utils
+
+
+class FakeCursor(object):
+    # every scope has the same clang_hashCursor value
+    hash = 1
+
+    def __init__(self, kind, displayname, semantic_parent=None):
+        self.kind = kind
+        self.displayname = displayname
+        self.semantic_parent = semantic_parent
+
+    def __eq__(self, other):
+        return self is other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return self.hash
+
+
+class ScopeNamesTest(unittest.TestCase):
+    def setUp(self):
+        utils.clear_name_cache()
+
+    def tearDown(self):
+        utils.clear_name_cache()
+
+    def test_nested_scopes(self):
+        ns = FakeCursor(cindex.CursorKind.NAMESPACE, "ns")
+        node = FakeCursor(cindex.CursorKind.CLASS_DECL, "Node", ns)
+        sprite = FakeCursor(cindex.CursorKind.CLASS_DECL, "Sprite", node)
+        self.assertEqual(utils.get_fullname(FakeCursor(cindex.CursorKind.CXX_METHOD, "draw", sprite)),
+                         "ns::Node::Sprite::draw")
+        self.assertEqual(utils.get_namespace_name(sprite), "ns")
+        # every scope is resolved once
+        self.assertEqual(len(utils._scope_names), 3)
+
+    def test_colliding_hashes(self):
+        ns = FakeCursor(cindex.CursorKind.NAMESPACE, "ns")
+        ui = FakeCursor(cindex.CursorKind.NAMESPACE, "ui")
+        node = FakeCursor(cindex.CursorKind.CLASS_DECL, "Node", ns)
+        widget = FakeCursor(cindex.CursorKind.CLASS_DECL, "Widget", ui)
+        self.assertEqual(utils.get_fullname(FakeCursor(cindex.CursorKind.CXX_METHOD, "draw", node)),
+                         "ns::Node::draw")
+        self.assertEqual(utils.get_fullname(FakeCursor(cindex.CursorKind.CXX_METHOD, "draw", widget)),
+                         "ui::Widget::draw")
+        self.assertEqual(utils.get_namespace_name(widget), "ui")
+
+
+class SplitContainerNameTest(unittest.TestCase):
+    def test_not_a_template(self):
+        self.assertEqual(utils.split_container_name(" int "), ["int"])
+        self.assertEqual(utils.split_container_name("std::vector<int"), ["std::vector<int"])
+
+    def test_single_argument(self):
+        self.assertEqual(utils.split_container_name("cocos2d::Vector<cocos2d::Node *>"),
+                         ["cocos2d::Vector", "cocos2d::Node *"])
+
+    def test_nested_arguments(self):
+        self.assertEqual(
+            utils.split_container_name("std::map<int, std::pair<int, float>, std::less<int>, "
+                                       "std::allocator<std::pair<const int, std::pair<int, float> > > >"),
+            ["std::map", "int", "std::pair<int, float>", "std::less<int>",
+             "std::allocator<std::pair<const int, std::pair<int, float> > >"])
+
+    def test_suffix(self):
+        self.assertEqual(
+            utils.split_container_name("const std::vector<cocos2d::Node *, std::allocator<cocos2d::Node *> > &"),
+            ["const std::vector", "cocos2d::Node *", "std::allocator<cocos2d::Node *>", "&"])
+
+
+class NormalizeTypeStrTest(unittest.TestCase):
+    def test_stl_containers(self):
+        self.assertEqual(utils.normalize_type_str("std::vector<int, std::allocator<int> >"), "std::vector<int>")
+        self.assertEqual(
+            utils.normalize_type_str("const std::vector<cocos2d::Node *, std::allocator<cocos2d::Node *> > &"),
+            "const std::vector<cocos2d::Node *>&")
+        self.assertEqual(
+            utils.normalize_type_str("std::unordered_map<std::string, cocos2d::Value, std::hash<std::string>, "
+                                     "std::equal_to<std::string>, "
+                                     "std::allocator<std::pair<const std::string, cocos2d::Value> > >"),
+            "std::unordered_map<std::string, cocos2d::Value>")
+
+    def test_strings(self):
+        self.assertEqual(utils.normalize_type_str("std::basic_string<char, std::char_traits<char>, "
+                                                  "std::allocator<char> >"), "std::string")
+        self.assertEqual(utils.normalize_type_str("const std::basic_string<char, std::char_traits<char>, "
+                                                  "std::allocator<char> > &"), "const std::string&")
+
+    def test_std_function(self):
+        self.assertEqual(utils.normalize_type_str("std::function<void (cocos2d::Ref *, int)>"),
+                         "std::function<void (cocos2d::Ref *, int)>")
+        self.assertEqual(utils.normalize_type_str("std::function<void ()>"), "std::function<void ()>")
+
+    def test_memoized(self):
+        utils.clear_name_cache()
+        name = "std::map<std::string, std::vector<int, std::allocator<int> > >"
+        self.assertEqual(utils.normalize_type_str(name), "std::map<std::string, std::vector<int>>")
+        self.assertEqual(utils._normalized_type_names[name], "std::map<std::string, std::vector<int>>")
+        # nested arguments are memoized too
+        self.assertEqual(utils._normalized_type_names["std::vector<int, std::allocator<int> >"], "std::vector<int>")
+        self.assertEqual(utils.normalize_type_str(name), "std::map<std::string, std::vector<int>>")
+        utils.clear_name_cache()
+        self.assertEqual(utils._normalized_type_names, {})
+
+    def test_deep_nesting(self):
+        name = "int"
+        for i in range(500):
+            name = "std::vector<%s, std::allocator<%s> >" % (name, name) if i < 5 else "std::list<%s>" % name
+        self.assertEqual(utils.normalize_type_str(name),
+                         "std::list<" * 495 + "std::vector<" * 5 + "int" + ">" * 500)
+
+
+if __name__ == '__main__':
+    unittest.main()